@@ -0,0 +1,201 @@
+# precomputed network analytics, stored as node attributes
+
+from collections import defaultdict
+import multiprocessing
+import random
+import networkx as nx
+
+from belfastdata.network import aggregate_edges
+
+try:
+    # optional; python-louvain community detection
+    import community as louvain
+except ImportError:
+    louvain = None
+
+
+class NetworkAnalytics(object):
+    # Calculates node metrics for a generated network (networkx graph or
+    # belfastdata.network.CompactNetwork) and adds them to the nodes as
+    # attributes, so they are included in exported network files instead
+    # of having to be calculated later by hand in Gephi:
+    #
+    #  - weighted_degree: sum of the weights of all edges to or from the node
+    #  - pagerank: weighted PageRank, following edge direction
+    #  - betweenness: normalized betweenness centrality, treating the
+    #    network as undirected and stronger connections as shorter paths
+    #  - community: community id (largest community is 0), using Louvain
+    #    modularity if python-louvain is installed, and otherwise
+    #    weighted label propagation
+    #
+    # Edge weights come from the network (see belfastdata.weights);
+    # parallel edges are combined by summing their weights.
+    #
+    # Betweenness is the most expensive calculation; for networks with
+    # more than max_exact_nodes nodes it is approximated from shortest
+    # paths starting at a random sample of nodes (sample_size, or
+    # default_sample_size if not specified).  If jobs is more than 1,
+    # shortest paths are calculated in a pool of worker processes.
+
+    # analytics version, for belfastdata.manifest; increment when
+    # changes mean previously generated output should be regenerated
+    version = 1
+
+    max_exact_nodes = 2000
+    default_sample_size = 500
+
+    def __init__(self, jobs=1, sample_size=None, seed=None):
+        self.jobs = jobs
+        self.sample_size = sample_size
+        self.seed = seed
+
+    def analyze(self, network):
+        # calculations use integer node ids, since comparing and
+        # hashing rdflib terms is comparatively slow
+        nodes = list(network.nodes_iter())
+        ids = dict((node, i) for i, node in enumerate(nodes))
+        digraph = nx.DiGraph()
+        digraph.add_nodes_from(xrange(len(nodes)))
+        for source, target, weight, counts in aggregate_edges(network):
+            digraph.add_edge(ids[source], ids[target], weight=weight)
+        graph = undirected(digraph)
+
+        metrics = {
+            'weighted_degree': self.weighted_degree(digraph),
+            'pagerank': nx.pagerank(digraph, weight='weight'),
+            'betweenness': self.betweenness(graph),
+            'community': self.communities(graph),
+        }
+        for name, values in metrics.iteritems():
+            for node_id, value in values.iteritems():
+                network.node[nodes[node_id]][name] = value
+
+        print 'Calculated network analytics: %d communities' % \
+            len(set(metrics['community'].itervalues()))
+        return metrics
+
+    def weighted_degree(self, digraph):
+        return dict((node, _number(degree)) for node, degree
+                    in digraph.degree_iter(weight='weight'))
+
+    def betweenness(self, graph):
+        nodes = graph.nodes()
+        n = len(nodes)
+        sample_size = self.sample_size
+        if sample_size is None and n > self.max_exact_nodes:
+            sample_size = self.default_sample_size
+        if sample_size is not None and sample_size < n:
+            sources = random.Random(self.seed).sample(nodes, sample_size)
+            print 'Approximating betweenness from %d of %d nodes' % (sample_size, n)
+        else:
+            sources = nodes
+
+        if self.jobs > 1 and len(sources) > self.jobs:
+            # split source nodes into one chunk per worker process
+            chunks = [sources[i::self.jobs] for i in range(self.jobs)]
+            pool = multiprocessing.Pool(self.jobs, _init_worker, (graph, ))
+            try:
+                partials = pool.map(_betweenness_sources, chunks)
+            finally:
+                pool.close()
+                pool.join()
+        else:
+            partials = [_source_betweenness(graph, sources)]
+
+        betweenness = dict.fromkeys(graph, 0.0)
+        for partial in partials:
+            for node, value in partial.iteritems():
+                betweenness[node] += value
+
+        # normalize as networkx.betweenness_centrality does (unnormalized
+        # undirected values are already halved), scaling up sampled values
+        if n > 2:
+            scale = 2.0 / ((n - 1) * (n - 2)) * (float(n) / len(sources))
+            for node in betweenness:
+                betweenness[node] *= scale
+        return betweenness
+
+    def communities(self, graph):
+        if louvain is not None:
+            partition = louvain.best_partition(graph, weight='weight')
+        else:
+            partition = label_propagation(graph, seed=self.seed)
+        # renumber communities by size, largest first
+        sizes = defaultdict(int)
+        for node, community in partition.iteritems():
+            sizes[community] += 1
+        order = sorted(sizes, key=lambda c: (-sizes[c], c))
+        ids = dict((community, i) for i, community in enumerate(order))
+        return dict((node, ids[community])
+                    for node, community in partition.iteritems())
+
+
+def undirected(digraph):
+    # undirected graph with the combined weight of the edges in either
+    # direction, and distance (inverse of weight) for shortest paths
+    graph = nx.Graph()
+    graph.add_nodes_from(digraph)
+    for source, target, data in digraph.edges_iter(data=True):
+        if graph.has_edge(source, target):
+            graph[source][target]['weight'] += data['weight']
+        else:
+            graph.add_edge(source, target, weight=data['weight'])
+    for source, target, data in graph.edges_iter(data=True):
+        data['distance'] = 1.0 / data['weight'] if data['weight'] > 0 else 1.0
+    return graph
+
+
+def label_propagation(graph, weight='weight', seed=None, max_iterations=100):
+    # weighted label propagation community detection: each node
+    # repeatedly adopts the community with the greatest total edge weight
+    # among its neighbors, until no node changes; returns a dictionary
+    # of node -> community id
+    rand = random.Random(seed)
+    labels = dict((node, i) for i, node in enumerate(graph))
+    nodes = graph.nodes()
+    for iteration in xrange(max_iterations):
+        rand.shuffle(nodes)
+        changed = False
+        for node in nodes:
+            totals = defaultdict(float)
+            for neighbor, data in graph[node].iteritems():
+                totals[labels[neighbor]] += data.get(weight, 1)
+            if not totals:
+                continue
+            best = max(totals.itervalues())
+            candidates = sorted(l for l, total in totals.iteritems()
+                                if total == best)
+            # keep the current community on a tie, so labels settle
+            if labels[node] in candidates:
+                continue
+            labels[node] = rand.choice(candidates)
+            changed = True
+        if not changed:
+            break
+    return labels
+
+
+def _number(value):
+    # return whole numbers as int
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    return value
+
+
+def _source_betweenness(graph, sources):
+    # unnormalized betweenness from shortest paths starting at sources
+    return nx.betweenness_centrality_source(graph, normalized=False,
+                                            weight='distance', sources=sources)
+
+
+# state for analytics worker processes
+_worker_graph = None
+
+
+def _init_worker(graph):
+    global _worker_graph
+    _worker_graph = graph
+
+
+def _betweenness_sources(sources):
+    return _source_betweenness(_worker_graph, sources)
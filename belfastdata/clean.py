@@ -1,22 +1,46 @@
 import hashlib
 import rdflib
-from rdflib import collection as rdfcollection
-from django.utils.text import slugify
 
+from belfastdata import normalize
+from belfastdata.pipeline import Pipeline
 from belfastdata.rdfns import BIBO, DC, SCHEMA_ORG, BG, BELFAST_GROUP_URI
+from belfastdata.snapshot import load_graph, save_snapshot
 
 
 class SmushGroupSheets(object):
 
+    # stage version, for belfastdata.manifest; increment when changes
+    # mean previously processed data should be redone
+    version = 1
+
     # base identifier for 'smushed' ids
     BELFASTGROUPSHEET = rdflib.Namespace("http://belfastgroup.library.emory.edu/groupsheets/md5/")
 
-    def __init__(self, files):
-        for f in files:
+    def __init__(self, files=None, jobs=1, index=None):
+        # index: optional belfastdata.dedup.GroupSheetIndex from a
+        # previous run; group sheets it records as already having their
+        # smushed uri are skipped without calculating the uri again,
+        # unless the file has changed since it was indexed
+        self.index = index
+        if files and jobs > 1:
+            Pipeline(files, [self], jobs=jobs, keep_graphs=False).run()
+            return
+        for f in files or []:
             self.process_file(f)
 
     def calculate_uri(self, uri, graph):
         # calculate a 'smushed' uri for a single groupsheet
+        key = self.smush_key(uri, graph)
+        if key is not None:
+            return self.uri_for_key(key)
+
+    def uri_for_key(self, key):
+        # 'smushed' uri for a smush key
+        return self.BELFASTGROUPSHEET[hashlib.md5(key.encode('utf-8')).hexdigest()]
+
+    def smush_key(self, uri, graph):
+        # identifying text for a single groupsheet, based on author and
+        # titles; groupsheets with the same key are considered duplicates
         titles = []
         title = graph.value(uri, DC.title)
 
@@ -26,21 +50,17 @@ class SmushGroupSheets(object):
             if isinstance(title, rdflib.Literal):
                 titles.append(title)
 
-            # otherwise, assuming node is an rdf sequence
+            # otherwise, assuming node is an rdf sequence; read the items
+            # directly (rdflib's Collection may modify the graph)
             else:
-                # convert from resource to standard blank node
-                # since collection doesn't seem to handle resource
-                # create a collection to allow treating as a list
-                titles.extend(rdfcollection.Collection(graph,
-                                                       title))
-
-        # ignore title order for the purposes of de-duping
-        # - sort titles so we can get a consistent MD5
-        #   (assumes any group sheet with the same titles in any order
-        #    and the same author is equivalent)
-        # - slugify titles so we can ignore discrepancies in case and punctuation
-        titles = sorted([slugify(t) for t in titles])
+                titles.extend(graph.items(title))
+
+        # titles are sorted and slugified for a consistent MD5;
+        # see belfastdata.normalize.smush_key
+        return normalize.smush_key(self._author(uri, graph), titles)
 
+    def _author(self, uri, graph):
+        # author uri or name for a groupsheet, for the smush key
         author = graph.value(uri, SCHEMA_ORG.author)
         # blank node for the author is unreliable...
         if isinstance(author, rdflib.BNode):
@@ -55,27 +75,34 @@ class SmushGroupSheets(object):
                 author = '%s, %s' % (last, first)
             else:
                 author = None
+        return author
 
-        # if not at least one title or title and author, skip this ms
-        if not titles and not author:
-            return
+    def groupsheets(self, graph):
+        # list of uri and smush key for the groupsheets in a document
+        # (key is None if there is not enough information to smush)
+        return [(m, self.smush_key(m, graph)) for m in
+                graph.subjects(predicate=rdflib.RDF.type, object=BG.GroupSheet)]
 
-        m = hashlib.md5()
-        if author is None:
-            author = 'anonymous'
-        text = '%s %s' % (author, ' '.join(titles))
-        m.update(text.encode('utf-8'))
+    def process_file(self, filename):
+        g = load_graph(filename)
 
-        return self.BELFASTGROUPSHEET[m.hexdigest()]
+        output = self.process_graph(g, filename)
+        if output is not None:
+            # NOTE: currently replaces the starting file.  Might not be ideal,
+            # but may actually be reasonable for the currently intended use.
+            # print 'Replacing %s' % filename
+            with open(filename, 'w') as datafile:
+                output.serialize(datafile)
+            save_snapshot(filename, output)
+
+    def process_graph(self, g, filename):
+        # smush group sheet URIs in a single document; returns the
+        # updated graph, or None if the document was not changed
 
-    def process_file(self, filename):
         # build a dictionary of "smushed" URIs for belfast group sheets
         # for this document
         new_uris = {}
 
-        g = rdflib.Graph()
-        g.parse(filename)
-
         # smushing should be done after infer/identify group sheets
         # and assign local group sheet type
         # SO - simply find by our belfast group sheet type
@@ -85,137 +112,167 @@ class SmushGroupSheets(object):
         if len(ms) == 0:
             # possibly print out in a verbose mode if we add that
             #print 'No groupsheets found in %s' % filename
-            return
+            return None
 
         # TEMP / sanity check
         print 'Found %d groupsheet%s in %s' % \
             (len(ms), 's' if len(ms) != 1 else '', filename)
 
+        smushed = set()
+        if self.index is not None:
+            smushed = self.index.smushed_uris(filename)
+
         for m in ms:
+            # already smushed on a previous run, and not changed since
+            if m in smushed:
+                continue
             # FIXME: only calculate a new uri for blank nodes?
             # TODO: handle TEI-based rdf with ARK pid urls
             newURI = self.calculate_uri(m, g)
-            if newURI is not None:
+            if newURI is not None and newURI != m:
                 new_uris[m] = newURI
 
-        output = rdflib.Graph()
-        # bind namespace prefixes from the input graph
-        for prefix, ns in g.namespaces():
-            output.bind(prefix, ns)
-
-        # iterate over all triples in the old graph and convert
-        # any uris in the new_uris dictionary to the smushed identifier
-        for s, p, o in g:
-            s = new_uris.get(s, s)
+        # if all groupsheets already have their smushed uris (e.g., the
+        # file was smushed on a previous run), don't rewrite the document
+        if not new_uris:
+            return None
+
+        self.rewrite_uris(g, new_uris)
+        return g
+
+    def rewrite_uris(self, g, new_uris):
+        # convert any uris in the new_uris dictionary to the smushed
+        # identifier, in place; only the triples that refer to those
+        # uris are looked up (by subject and object) and replaced,
+        # rather than copying the whole graph
+        changed = set()
+        for uri in new_uris:
+            changed.update(g.triples((uri, None, None)))
             # don't convert a smushed URL (e.g., TEI groupsheet URL)
+            changed.update((s, p, uri) for s, p in g.subject_predicates(uri)
+                           if p != SCHEMA_ORG.URL)
+
+        # remove all old triples before adding any new ones, so the
+        # result does not depend on the order uris are replaced
+        for triple in changed:
+            g.remove(triple)
+        for s, p, o in changed:
+            s = new_uris.get(s, s)
             if not p == SCHEMA_ORG.URL:
                 o = new_uris.get(o, o)
-            output.add((s, p, o))
-
-        # NOTE: currently replaces the starting file.  Might not be ideal,
-        # but may actually be reasonable for the currently intended use.
-        # print 'Replacing %s' % filename
-        with open(filename, 'w') as datafile:
-            output.serialize(datafile)
+            g.add((s, p, o))
 
 
 class IdentifyGroupSheets(object):
 
-    def __init__(self, files):
-        for f in files:
+    version = 1
+
+    belfast_group = rdflib.URIRef(BELFAST_GROUP_URI)
+
+    def __init__(self, files=None):
+        for f in files or []:
             self.process_file(f)
 
     def process_file(self, filename):
-        # identify belfast group sheets and label them with our local
-        # belfast group sheet type
+        g = load_graph(filename)
+
+        if self.process_graph(g, filename) is not None:
+            #print 'Replacing %s' % filename
+            with open(filename, 'w') as datafile:
+                g.serialize(datafile)
+            save_snapshot(filename, g)
 
-        g = rdflib.Graph()
-        g.parse(filename)
+    def process_graph(self, g, filename):
+        # identify belfast group sheets and label them with our local
+        # belfast group sheet type; returns the updated graph, or
+        # None if no group sheets were found
+        return self.process_graphs({filename: g}).get(filename)
+
+    def process_graphs(self, graphs):
+        # identify group sheets in a batch of graphs keyed on filename;
+        # returns a dictionary of the updated graphs, for files where
+        # group sheets were found
+        updated = {}
+        for filename, g in graphs.iteritems():
+            ms = self.find_groupsheets(g)
+
+            # if no manuscripts are found, do not update the file
+            if not ms:
+                # possibly print out in a verbose mode if we add that
+                # print 'No groupsheets found in %s' % filename
+                continue
+
+            print 'Found %d groupsheet%s in %s' % \
+                (len(ms), 's' if len(ms) != 1 else '', filename)
+
+            for m in ms:
+                g.add((m, rdflib.RDF.type, BG.GroupSheet))
+            updated[filename] = g
+
+        return updated
+
+    def find_groupsheets(self, g):
+        # find group sheets in a single graph, using triple pattern
+        # lookups rather than sparql queries, which rdflib would parse
+        # and plan again for every document
 
         # some collections include group sheets mixed with other content
         # (irishmisc, ormsby)
         # first look for a manuscript with an author that directly
         # references the belfast group
-        res = g.query('''
-            PREFIX schema: <%(schema)s>
-            PREFIX rdf: <%(rdf)s>
-            PREFIX bibo: <%(bibo)s>
-            SELECT ?ms
-            WHERE {
-                ?ms rdf:type bibo:Manuscript .
-                ?ms schema:mentions <%(belfast_group)s> .
-                ?ms schema:author ?auth
-            }
-            ''' % {'schema': SCHEMA_ORG,
-                   'rdf': rdflib.RDF,
-                   'bibo': BIBO,
-                   'belfast_group': BELFAST_GROUP_URI
-                   }
-            )
-            # searching for all manuscript that 'mention' belfast group
-            # NOTE: schema:mentions NOT the right relation here;
-            # needs to be fixed in findingaids and then here
+        # NOTE: schema:mentions NOT the right relation here;
+        # needs to be fixed in findingaids and then here
+        ms = self._distinct(
+            m for m in g.subjects(SCHEMA_ORG.mentions, self.belfast_group)
+            if (m, rdflib.RDF.type, BIBO.Manuscript) in g
+            and g.value(m, SCHEMA_ORG.author) is not None)
 
         # if no matches, do a greedier search
-        if len(res) == 0:
-
+        if not ms:
             # Find every manuscript mentioned in a document
             # that is *about* the belfast group
             # TODO: will also need to find ms associated with / presented at BG
             # NOTE: need a way to filter non-belfast group content
-            res = g.query('''
-                PREFIX schema: <%(schema)s>
-                PREFIX rdf: <%(rdf)s>
-                PREFIX bibo: <%(bibo)s>
-                SELECT ?ms
-                WHERE {
-                    ?doc schema:about <%(belfast_group)s> .
-                    ?doc schema:mentions ?ms .
-                    ?ms rdf:type bibo:Manuscript .
-                }
-                ''' % {'schema': SCHEMA_ORG,
-                       'rdf': rdflib.RDF,
-                       'bibo': BIBO,
-                       'belfast_group': BELFAST_GROUP_URI
-                       }
-            )
             # TODO: how to filter out non-group sheet irish misc content?
             # FIXME: not finding group sheets in irishmisc! (no titles?)
+            ms = self._distinct(
+                m for doc in g.subjects(SCHEMA_ORG.about, self.belfast_group)
+                for m in g.objects(doc, SCHEMA_ORG.mentions)
+                if (m, rdflib.RDF.type, BIBO.Manuscript) in g)
 
-        # if no manuscripts are found, stop and do not update the file
-        if len(res) == 0:
-            # possibly print out in a verbose mode if we add that
-            # print 'No groupsheets found in %s' % filename
-            return
+        return ms
 
-        print 'Found %d groupsheet%s in %s' % \
-            (len(res), 's' if len(res) != 1 else '', filename)
-
-        for r in res:
-            g.add((r['ms'], rdflib.RDF.type, BG.GroupSheet))
-
-        #print 'Replacing %s' % filename
-        with open(filename, 'w') as datafile:
-            g.serialize(datafile)
+    def _distinct(self, items):
+        # unique items, in order found
+        seen = set()
+        return [i for i in items if not (i in seen or seen.add(i))]
 
 
 class InferConnections(object):
 
-    def __init__(self, files):
-        for f in files:
+    version = 1
+
+    def __init__(self, files=None):
+        for f in files or []:
             self.process_file(f)
 
     def process_file(self, filename):
-        # identify belfast group sheets and label them with our local
-        # belfast group sheet type
+        g = load_graph(filename)
 
-        g = rdflib.Graph()
-        g.parse(filename)
+        if self.process_graph(g, filename) is not None:
+            with open(filename, 'w') as datafile:
+                g.serialize(datafile)
+            save_snapshot(filename, g)
+
+    def process_graph(self, g, filename):
+        # infer that group sheet authors are affiliated with the
+        # belfast group; returns the updated graph, or None if
+        # nothing new was inferred
 
         ms = list(g.subjects(predicate=rdflib.RDF.type, object=BG.GroupSheet))
         # if no manuscripts are found, skip
         if len(ms) == 0:
-            return
+            return None
 
         res = g.query('''
                 PREFIX schema: <%(schema)s>
@@ -239,6 +296,5 @@ class InferConnections(object):
                 g.add(bg_assoc)
 
         if modified:
-            with open(filename, 'w') as datafile:
-                g.serialize(datafile)
+            return g
 
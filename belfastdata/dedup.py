@@ -0,0 +1,167 @@
+# corpus-wide index of group sheets, for de-duplication across documents
+
+from collections import defaultdict
+import json
+import multiprocessing
+import os
+import rdflib
+
+from belfastdata.clean import SmushGroupSheets
+from belfastdata.manifest import file_hash
+from belfastdata.snapshot import load_graph
+
+
+class GroupSheetIndex(object):
+    # Persistent index of the group sheets in every document: smush key
+    # (see SmushGroupSheets.smush_key) -> canonical 'smushed' uri ->
+    # source files.  Smushing gives duplicate group sheets the same uri
+    # one document at a time; the index gives a global view of which
+    # documents describe the same group sheet (merge clusters).  When
+    # passed to SmushGroupSheets, group sheets the index records as
+    # already smushed are not smushed again, as long as the file they
+    # are in has not changed since it was indexed.
+    #
+    # The index is saved as json.  For each indexed file it records
+    # the content hash (as in belfastdata.manifest.Manifest) and the
+    # group sheets found, so on subsequent runs only new or changed
+    # files need to be indexed again.
+
+    # increment if the index format or smush keys change
+    version = 1
+
+    def __init__(self, filename=None):
+        self.filename = filename
+        # filename -> {hash, mtime, size, groupsheets: [[uri, key], ...]}
+        self.files = {}
+        if filename is not None and os.path.exists(filename):
+            try:
+                with open(filename) as indexfile:
+                    data = json.load(indexfile)
+                if data.get('version') == self.version:
+                    self.files = data.get('files', {})
+            except ValueError:
+                pass
+        self._update_keys()
+
+    def build(self, files, graphs=None, jobs=1):
+        # index any new or changed files, and drop files no longer in
+        # the list; graphs is an optional dictionary of already loaded
+        # graphs keyed on filename (which should match the current file
+        # content); other files are loaded and indexed in a pool of
+        # jobs worker processes.  Returns the number of files indexed.
+        graphs = graphs or {}
+        files = [f for f in files if os.path.exists(f)]
+        for filename in set(self.files) - set(files):
+            del self.files[filename]
+
+        hashes = dict((f, file_hash(f, self.files.get(f))) for f in files)
+        pending = [f for f in files if f not in self.files or
+                   self.files[f]['hash'] != hashes[f]]
+
+        smush = SmushGroupSheets()
+        results = [(f, smush.groupsheets(graphs[f])) for f in pending if f in graphs]
+        to_load = [f for f in pending if f not in graphs]
+        if jobs > 1 and len(to_load) > 1:
+            pool = multiprocessing.Pool(jobs)
+            try:
+                results.extend(pool.imap(_index_file, to_load, chunksize=10))
+            finally:
+                pool.close()
+                pool.join()
+        else:
+            results.extend(_index_file(f) for f in to_load)
+
+        for filename, groupsheets in results:
+            if groupsheets is None:
+                continue
+            stat = os.stat(filename)
+            self.files[filename] = {
+                'hash': hashes[filename],
+                'mtime': stat.st_mtime,
+                'size': stat.st_size,
+                'groupsheets': [[unicode(uri), key] for uri, key in groupsheets],
+            }
+        self._update_keys()
+        return len(results)
+
+    def clear(self):
+        # forget all indexed files, so everything is indexed again
+        self.files = {}
+        self._update_keys()
+
+    def _update_keys(self):
+        # smush key -> canonical uri -> source file -> count
+        smush = SmushGroupSheets()
+        self.keys = {}
+        for filename, entry in self.files.iteritems():
+            for uri, key in entry['groupsheets']:
+                if key is None:
+                    continue
+                if key not in self.keys:
+                    self.keys[key] = (unicode(smush.uri_for_key(key)), defaultdict(int))
+                self.keys[key][1][filename] += 1
+
+    def canonical_uri(self, key):
+        # canonical uri for a smush key, or None if not indexed
+        if key in self.keys:
+            return self.keys[key][0]
+
+    def smushed_uris(self, filename):
+        # uris of the group sheets in a file that already had the
+        # canonical uri for their smush key when the file was indexed;
+        # empty if the file is not indexed or has changed since then,
+        # since its group sheets may no longer have the same keys
+        entry = self.files.get(filename)
+        if entry is None or not os.path.exists(filename) or \
+           file_hash(filename, entry) != entry['hash']:
+            return set()
+        return set(rdflib.URIRef(uri) for uri, key in entry['groupsheets']
+                   if key is not None and uri == self.keys[key][0])
+
+    def sources(self, key):
+        # source files for a smush key, with the number of times
+        # the group sheet occurs in each
+        if key in self.keys:
+            return dict(self.keys[key][1])
+        return {}
+
+    def clusters(self):
+        # group sheets that occur more than once, as a list of smush key,
+        # canonical uri, and source files (as for sources), largest first
+        clusters = [(key, uri, dict(sources))
+                    for key, (uri, sources) in self.keys.iteritems()
+                    if sum(sources.itervalues()) > 1]
+        return sorted(clusters, key=lambda c: (-sum(c[2].itervalues()), c[0]))
+
+    def summary(self):
+        total = sum(len(entry['groupsheets']) for entry in self.files.itervalues())
+        return '%d groupsheet%s in %d file%s; %d distinct, %d with duplicates' % \
+            (total, 's' if total != 1 else '', len(self.files),
+             's' if len(self.files) != 1 else '', len(self.keys),
+             len(self.clusters()))
+
+    def report(self):
+        # text report of the merge clusters
+        lines = []
+        for key, uri, sources in self.clusters():
+            lines.append(u'%s  (%d)' % (uri, sum(sources.itervalues())))
+            lines.append(u'  %s' % key)
+            for filename, count in sorted(sources.iteritems()):
+                lines.append(u'    %s%s' % (filename, ' x%d' % count if count > 1 else ''))
+        return '\n'.join(lines)
+
+    def save(self):
+        with open(self.filename, 'w') as indexfile:
+            json.dump({'version': self.version, 'files': self.files}, indexfile,
+                      indent=2, sort_keys=True)
+
+
+def _index_file(filename):
+    # group sheets in a single file, for indexing in a worker process;
+    # None if the file could not be loaded
+    try:
+        graph = load_graph(filename)
+    except Exception as err:
+        print "Error parsing '%s' as RDF -- %s" % (filename, err)
+        return filename, None
+    return filename, SmushGroupSheets().groupsheets(graph)
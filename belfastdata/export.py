@@ -0,0 +1,222 @@
+# export generated networks in formats other than GEXF
+
+import csv
+import gzip
+import json
+import os
+from xml.sax.saxutils import escape
+
+from belfastdata.gexfwriter import GexfWriter
+from belfastdata.query import IndexExporter
+from belfastdata.network import aggregate_edges, node_attribute_names, \
+    node_attribute_types
+
+
+def _open(filename):
+    # open an output file for writing, gzip-compressed
+    # if the filename ends with .gz
+    if filename.endswith('.gz'):
+        return gzip.open(filename, 'wb')
+    return open(filename, 'wb')
+
+
+class NetworkExporter(object):
+    # Base class for network output formats.  Exporters take the same
+    # aggregate and label_counts options as GexfWriter, and write
+    # a network to a file with write(network, outfile).
+
+    def __init__(self, aggregate=False, label_counts=False):
+        self.aggregate = aggregate
+        self.label_counts = label_counts
+
+    def edges(self, network):
+        # generate edges as source, target, weight, label, and number
+        # of original edges by relation (aggregated edges only)
+        if self.aggregate:
+            for source, target, weight, counts in aggregate_edges(network):
+                yield source, target, weight, ', '.join(sorted(counts)), counts
+        else:
+            for source, target, attrs in network.edges_iter(data=True):
+                yield source, target, attrs.get('weight', 1), \
+                    attrs.get('label'), None
+
+    def edge_labels(self, network):
+        # distinct edge labels, for label counts
+        return sorted(set(attrs.get('label') for s, t, attrs
+                          in network.edges_iter(data=True)))
+
+    def write(self, network, outfile):
+        raise NotImplementedError
+
+
+class GraphmlExporter(NetworkExporter):
+    # GraphML, written incrementally
+
+    header = '''<?xml version='1.0' encoding='utf-8'?>
+<graphml xmlns="http://graphml.graphdrawing.org/xmlns" xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance" xsi:schemaLocation="http://graphml.graphdrawing.org/xmlns http://graphml.graphdrawing.org/xmlns/1.0/graphml.xsd">
+'''
+
+    # graphml names for attribute types
+    types = {'string': 'string', 'integer': 'int', 'double': 'double'}
+
+    def write(self, network, outfile):
+        node_attr_types = node_attribute_types(network)
+        node_attrs = ['label'] + sorted(node_attr_types)
+        node_attr_types['label'] = 'string'
+        edge_labels = []
+        if self.aggregate and self.label_counts:
+            edge_labels = self.edge_labels(network)
+
+        with _open(outfile) as out:
+            out.write(self.header)
+            keys = {}
+            for name in node_attrs:
+                keys[('node', name)] = 'd%d' % len(keys)
+                self._key(out, keys[('node', name)], 'node', name,
+                          self.types[node_attr_types[name]])
+            for name, attr_type in [('label', 'string'), ('weight', 'double')]:
+                keys[('edge', name)] = 'd%d' % len(keys)
+                self._key(out, keys[('edge', name)], 'edge', name, attr_type)
+            for name in edge_labels:
+                keys[('count', name)] = 'd%d' % len(keys)
+                self._key(out, keys[('count', name)], 'edge', name, 'int')
+
+            out.write('  <graph edgedefault="directed">\n')
+            for node, attrs in network.nodes_iter(data=True):
+                out.write('    <node id=%s>\n' % _quote(node))
+                for name, value in sorted(attrs.items()):
+                    self._data(out, keys[('node', name)], value)
+                out.write('    </node>\n')
+
+            for source, target, weight, label, counts in self.edges(network):
+                out.write('    <edge source=%s target=%s>\n' %
+                          (_quote(source), _quote(target)))
+                self._data(out, keys[('edge', 'label')], label)
+                self._data(out, keys[('edge', 'weight')], weight)
+                if counts and edge_labels:
+                    for name, count in sorted(counts.iteritems()):
+                        self._data(out, keys[('count', name)], count)
+                out.write('    </edge>\n')
+            out.write('  </graph>\n</graphml>\n')
+
+    def _key(self, out, key_id, domain, name, attr_type):
+        out.write('  <key id="%s" for="%s" attr.name=%s attr.type="%s" />\n' %
+                  (key_id, domain, _quote(name), attr_type))
+
+    def _data(self, out, key_id, value):
+        if value is not None:
+            out.write('      <data key="%s">%s</data>\n' %
+                      (key_id, escape(unicode(value)).encode('utf-8')))
+
+
+class CsvExporter(NetworkExporter):
+    # Node and edge lists as two gzip-compressed CSV files, named based
+    # on the output filename: e.g. network.csv.gz is written as
+    # network-nodes.csv.gz and network-edges.csv.gz
+
+    def filenames(self, outfile):
+        base = outfile
+        for ext in ['.gz', '.csv']:
+            if base.endswith(ext):
+                base = base[:-len(ext)]
+        return '%s-nodes.csv.gz' % base, '%s-edges.csv.gz' % base
+
+    def write(self, network, outfile):
+        nodefile, edgefile = self.filenames(outfile)
+        node_attrs = ['label'] + node_attribute_names(network)
+        with _open(nodefile) as out:
+            writer = csv.writer(out)
+            writer.writerow(['id'] + node_attrs)
+            for node, attrs in network.nodes_iter(data=True):
+                writer.writerow([_encode(node)] +
+                                [_encode(attrs.get(name)) for name in node_attrs])
+
+        edge_labels = []
+        if self.aggregate and self.label_counts:
+            edge_labels = self.edge_labels(network)
+        with _open(edgefile) as out:
+            writer = csv.writer(out)
+            writer.writerow(['source', 'target', 'label', 'weight'] +
+                            [_encode(l) for l in edge_labels])
+            for source, target, weight, label, counts in self.edges(network):
+                row = [_encode(source), _encode(target), _encode(label), weight]
+                if edge_labels:
+                    row.extend(counts.get(l, 0) for l in edge_labels)
+                writer.writerow(row)
+
+
+class JsonExporter(NetworkExporter):
+    # Compact json for d3 force-directed layouts: a list of nodes with
+    # their attributes, and a list of links that refer to nodes by
+    # position in the node list.  Gzip-compressed if the output
+    # filename ends with .gz.
+
+    def write(self, network, outfile):
+        index = {}
+        with _open(outfile) as out:
+            out.write('{"nodes":[')
+            for i, (node, attrs) in enumerate(network.nodes_iter(data=True)):
+                index[node] = i
+                data = dict((name, _json_value(value))
+                            for name, value in attrs.items())
+                data['id'] = unicode(node)
+                out.write('%s%s' % (',' if i else '', self._dumps(data)))
+            out.write('],"links":[')
+            for i, (source, target, weight, label, counts) in \
+                    enumerate(self.edges(network)):
+                data = {'source': index[source], 'target': index[target],
+                        'label': label, 'weight': weight}
+                if counts and self.label_counts:
+                    data['counts'] = counts
+                out.write('%s%s' % (',' if i else '', self._dumps(data)))
+            out.write(']}')
+
+    def _dumps(self, data):
+        return json.dumps(data, separators=(',', ':'), sort_keys=True)
+
+
+# exporters by file extension
+exporters = {
+    'gexf': GexfWriter,
+    'graphml': GraphmlExporter,
+    'csv': CsvExporter,
+    'json': JsonExporter,
+    'netidx': IndexExporter,
+}
+
+
+def output_format(filename):
+    # output format for a filename, based on the extension
+    # (ignoring .gz); raises ValueError if not supported
+    name = filename.lower()
+    if name.endswith('.gz'):
+        name = name[:-3]
+    ext = os.path.splitext(name)[1].lstrip('.')
+    if ext not in exporters:
+        raise ValueError('Unsupported network output format: %s (supported: %s)' %
+                         (filename, ', '.join(sorted(exporters))))
+    return ext
+
+
+def get_exporter(filename, **options):
+    # initialize the exporter for the format of the specified file
+    return exporters[output_format(filename)](**options)
+
+
+def _quote(value):
+    return '"%s"' % escape(unicode(value), {'"': '&quot;', '\n': '&#10;',
+                                            '\r': '&#13;', '\t': '&#9;'}).encode('utf-8')
+
+
+def _json_value(value):
+    # numbers as is, everything else (e.g. rdflib literals) as a string
+    if isinstance(value, (int, long, float)):
+        return value
+    return unicode(value)
+
+
+def _encode(value):
+    # csv values in python 2 must be byte strings
+    if value is None:
+        return ''
+    return unicode(value).encode('utf-8')
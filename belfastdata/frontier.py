@@ -0,0 +1,70 @@
+# url frontier for crawling related pages
+
+from collections import deque
+from urlparse import urlsplit, urlunsplit
+
+
+DEFAULT_PORTS = {'http': 80, 'https': 443}
+
+
+def canonical_url(url):
+    # normalize a url for the purposes of duplicate detection:
+    # scheme and host are case-insensitive, default ports and
+    # fragments are irrelevant, and a trailing slash on the path
+    # does not identify a different page
+    parts = urlsplit(url.strip())
+    scheme = parts.scheme.lower()
+    host = (parts.hostname or '').lower()
+    if parts.port and parts.port != DEFAULT_PORTS.get(scheme):
+        host = '%s:%s' % (host, parts.port)
+    path = parts.path.rstrip('/') or '/'
+    return urlunsplit((scheme, host, path, parts.query, ''))
+
+
+class UrlFrontier(object):
+    # queue of urls waiting to be harvested, plus a hashed set of every
+    # canonical url ever queued, so that each page is fetched exactly once
+    # and membership checks are constant time.
+    #
+    # Optionally limits crawl depth (seed urls are depth 0; pages found
+    # on them are depth 1, etc) and restricts the crawl to a set of hosts.
+
+    def __init__(self, urls=None, max_depth=None, hosts=None):
+        self.max_depth = max_depth
+        self.hosts = set(h.lower() for h in hosts) if hosts else None
+        self._queue = deque()
+        self._seen = set()
+        for url in urls or []:
+            self.add(url)
+
+    def add(self, url, depth=0):
+        # queue a url unless it was already seen or falls outside the
+        # configured limits; returns True if the url was queued
+        if self.max_depth is not None and depth > self.max_depth:
+            return False
+        key = canonical_url(url)
+        if key in self._seen:
+            return False
+        if self.hosts is not None and \
+           urlsplit(key).netloc not in self.hosts:
+            return False
+        self._seen.add(key)
+        # harvest the url as given (minus any fragment), since
+        # the server may distinguish a trailing slash
+        self._queue.append((url.split('#', 1)[0], depth))
+        return True
+
+    def pop(self):
+        # next url and its depth, in the order they were added
+        return self._queue.popleft()
+
+    def __len__(self):
+        # number of urls still waiting to be harvested
+        return len(self._queue)
+
+    def __nonzero__(self):
+        return bool(self._queue)
+
+    def __contains__(self, url):
+        # true if the url has been queued at any point
+        return canonical_url(url) in self._seen
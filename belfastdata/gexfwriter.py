@@ -0,0 +1,132 @@
+# streaming GEXF output for generated networks
+
+import codecs
+import gzip
+from xml.sax.saxutils import escape
+
+from belfastdata.network import aggregate_edges, node_attribute_types
+
+
+class GexfWriter(object):
+    # Writes a network (networkx graph or belfastdata.network.CompactNetwork)
+    # as GEXF, one node or edge at a time, rather than building the
+    # whole xml document in memory as networkx.write_gexf does.
+    #
+    # If aggregate is True, parallel edges between the same two nodes
+    # (e.g. a person who is both author and creator of a document) are
+    # collapsed into a single edge, weighted by the sum of the weights
+    # of the original edges (see belfastdata.weights) and
+    # labeled with the distinct relations.  If label_counts is also True,
+    # the number of original edges for each relation is included as an
+    # edge attribute.  Output is gzip-compressed if the filename
+    # ends with .gz.
+
+    header = '''<?xml version='1.0' encoding='utf-8'?>
+<gexf version="1.1" xmlns="http://www.gexf.net/1.1draft" xmlns:viz="http://www.gexf.net/1.1draft/viz" xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance" xsi:schemaLocation="http://www.w3.org/2001/XMLSchema-instance">
+  <graph defaultedgetype="directed" mode="static">
+'''
+    footer = '''  </graph>
+</gexf>
+'''
+
+    def __init__(self, aggregate=False, label_counts=False):
+        self.aggregate = aggregate
+        self.label_counts = label_counts
+
+    def write(self, network, outfile):
+        node_attr_types = node_attribute_types(network)
+        node_attrs = sorted(node_attr_types)
+        if self.aggregate:
+            edges = aggregate_edges(network)
+            edge_labels = sorted(set(l for s, t, w, counts in edges
+                                     for l in counts))
+        else:
+            edges = None
+            edge_labels = []
+
+        if outfile.endswith('.gz'):
+            stream = gzip.open(outfile, 'wb')
+        else:
+            stream = open(outfile, 'wb')
+        with codecs.getwriter('utf-8')(stream) as out:
+            out.write(self.header)
+
+            # declare edge attributes; attribute ids are
+            # numbered across both edge and node attributes
+            edge_attr_ids = {'label': 0}
+            if self.label_counts:
+                for label in edge_labels:
+                    edge_attr_ids[label] = len(edge_attr_ids)
+            out.write('    <attributes class="edge" mode="static">\n')
+            out.write(self._attribute('label', 0, 'string'))
+            if self.label_counts:
+                for label in edge_labels:
+                    out.write(self._attribute(label, edge_attr_ids[label],
+                                              'integer'))
+            out.write('    </attributes>\n')
+
+            node_attr_ids = dict((name, len(edge_attr_ids) + i)
+                                 for i, name in enumerate(node_attrs))
+            out.write('    <attributes class="node" mode="static">\n')
+            for name in node_attrs:
+                out.write(self._attribute(name, node_attr_ids[name],
+                                          node_attr_types[name]))
+            out.write('    </attributes>\n')
+
+            out.write('    <nodes>\n')
+            for node, attrs in network.nodes_iter(data=True):
+                self._write_node(out, node, attrs, node_attr_ids)
+            out.write('    </nodes>\n')
+
+            out.write('    <edges>\n')
+            if edges is None:
+                for i, (source, target, attrs) in \
+                        enumerate(network.edges_iter(data=True)):
+                    self._write_edge(out, i, source, target,
+                                     attrs.get('weight', 1),
+                                     {0: attrs.get('label')})
+            else:
+                for i, (source, target, weight, counts) in enumerate(edges):
+                    values = {0: ', '.join(sorted(counts))}
+                    if self.label_counts:
+                        for label, count in counts.iteritems():
+                            values[edge_attr_ids[label]] = count
+                    self._write_edge(out, i, source, target, weight, values)
+            out.write('    </edges>\n')
+            out.write(self.footer)
+
+    def _attribute(self, title, attr_id, attr_type):
+        return '      <attribute id="%d" title=%s type="%s" />\n' % \
+            (attr_id, _quote(title), attr_type)
+
+    def _write_node(self, out, node, attrs, attr_ids):
+        label = attrs.get('label', node)
+        out.write('      <node id=%s label=%s>\n' % (_quote(node), _quote(label)))
+        values = [(attr_ids[name], value) for name, value in attrs.items()
+                  if name != 'label']
+        self._write_values(out, values)
+        out.write('      </node>\n')
+
+    def _write_edge(self, out, edge_id, source, target, weight, values):
+        out.write('      <edge id="%d" source=%s target=%s weight=%s>\n' %
+                  (edge_id, _quote(source), _quote(target), _quote(weight)))
+        self._write_values(out, values.items())
+        out.write('      </edge>\n')
+
+    def _write_values(self, out, values):
+        values = [(attr_id, value) for attr_id, value in values
+                  if value is not None]
+        if not values:
+            return
+        out.write('        <attvalues>\n')
+        for attr_id, value in sorted(values):
+            out.write('          <attvalue for="%d" value=%s />\n' %
+                      (attr_id, _quote(value)))
+        out.write('        </attvalues>\n')
+
+
+def _quote(value):
+    # quoted xml attribute value; newlines and tabs are escaped
+    # so they are preserved when the value is read back in
+    return '"%s"' % escape(unicode(value), {'"': '&quot;', '\n': '&#10;',
+                                            '\r': '&#13;', '\t': '&#9;'})
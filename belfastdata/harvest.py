@@ -2,9 +2,13 @@
 
 import os
 import glob
+import Queue
 import rdflib
 import requests
 import sys
+import threading
+import time
+from contextlib import contextmanager
 from urlparse import urlparse
 
 try:
@@ -12,85 +16,221 @@ try:
 except ImportError:
     ProgressBar = None
 
+from belfastdata.frontier import UrlFrontier
+from belfastdata.httpcache import HttpCache
+from belfastdata.session import HarvestSession, RetryJournal
+from belfastdata.snapshot import load_graph, save_snapshot
 from belfastdata.rdfns import DC, SCHEMA_ORG
 
 
-class HarvestRdf(object):
+class HostLimiter(object):
+    # per-host politeness limits for concurrent harvesting: caps the
+    # number of simultaneous requests to any one host, and optionally
+    # enforces a minimum delay (in seconds) between the start of
+    # successive requests to the same host
+
+    def __init__(self, max_per_host=2, delay=None):
+        self.max_per_host = max_per_host
+        self.delay = delay
+        self._lock = threading.Lock()
+        self._semaphores = {}
+        self._next_slot = {}
+
+    def _semaphore(self, host):
+        with self._lock:
+            if host not in self._semaphores:
+                self._semaphores[host] = threading.BoundedSemaphore(self.max_per_host)
+            return self._semaphores[host]
+
+    def _wait_turn(self, host):
+        # reserve the next available start time for this host under
+        # the lock, then sleep outside of it so other hosts aren't blocked
+        with self._lock:
+            now = time.time()
+            start = max(now, self._next_slot.get(host, now))
+            self._next_slot[host] = start + self.delay
+        if start > now:
+            time.sleep(start - now)
+
+    @contextmanager
+    def limit(self, url):
+        host = urlparse(url).netloc.lower()
+        semaphore = self._semaphore(host)
+        semaphore.acquire()
+        try:
+            if self.delay:
+                self._wait_turn(host)
+            yield
+        finally:
+            semaphore.release()
 
-    URL_QUEUE = []
-    PROCESSED_URLS = []
-    total = 0
-    harvested = 0
-    errors = 0
 
-    def __init__(self, urls, output_dir, find_related=False, verbosity=1):
-        self.URL_QUEUE.extend(urls)
+class HarvestRdf(object):
+
+    # name of the retry journal, relative to the output directory
+    journal_file = '.harvest-rdf-retry.json'
+
+    def __init__(self, urls, output_dir, find_related=False, verbosity=1,
+                 workers=1, max_per_host=2, delay=None, max_depth=None,
+                 hosts=None, session=None, retry_failed=True):
+        self.frontier = UrlFrontier(urls, max_depth=max_depth, hosts=hosts)
+        # failed urls are journaled in the output directory so
+        # a later run can try them again
+        self.journal = RetryJournal(os.path.join(output_dir, self.journal_file))
+        if retry_failed:
+            for url in self.journal.urls():
+                self.frontier.add(url)
+        self.total = 0
+        self.harvested = 0
+        self.unchanged = 0
+        self.errors = 0
+        self.cache = HttpCache()
+        self.session = session or HarvestSession(pool_size=max(10, workers))
         self.find_related = find_related
         self.base_dir = output_dir
         self.verbosity = verbosity
+        self.workers = max(1, workers)
+        self.limiter = HostLimiter(max_per_host, delay)
+        # guards the url queue and counters when harvesting concurrently;
+        # also used to wake idle workers when new urls are queued
+        self._lock = threading.Condition()
+        self._active = 0
 
         self.process_urls()
 
     def process_urls(self):
-        if (len(self.URL_QUEUE) >= 5 or self.find_related) \
+        if (len(self.frontier) >= 5 or self.find_related) \
            and ProgressBar and os.isatty(sys.stderr.fileno()):
             widgets = [Percentage(), ' (', SimpleProgress(), ')',
                        Bar(), ETA()]
-            progress = ProgressBar(widgets=widgets,
-                                   maxval=len(self.URL_QUEUE)).start()
-            processed = 0
+            self.progress = ProgressBar(widgets=widgets,
+                                        maxval=len(self.frontier)).start()
         else:
-            progress = None
+            self.progress = None
 
-        while self.URL_QUEUE:
-            url = self.URL_QUEUE.pop(0)
-            self.harvest_rdf(url)
-            self.total += 1
-            self.PROCESSED_URLS.append(url)
-            if progress:
-                progress.maxval = self.total + len(self.URL_QUEUE)
-                progress.update(len(self.PROCESSED_URLS))
-
-        if progress:
-            progress.finish()
+        if self.workers == 1:
+            while self.frontier:
+                url, depth = self.frontier.pop()
+                self.harvest_rdf(url, depth)
+                self._processed()
+        else:
+            threads = [threading.Thread(target=self._worker)
+                       for i in range(self.workers)]
+            for t in threads:
+                t.daemon = True
+                t.start()
+            for t in threads:
+                t.join()
+
+        if self.progress:
+            self.progress.finish()
+        self.journal.save()
 
         # report if sufficient numbers:
-        if self.verbosity >= 1 and (self.harvested > 5 or self.errors):
-            print 'Processed %d url%s: %d harvested, %d error%s' % \
-                  (len(self.PROCESSED_URLS),
-                   '' if len(self.PROCESSED_URLS) == 1 else 's',
-                   self.harvested, self.errors,
+        if self.verbosity >= 1 and \
+           (self.harvested + self.unchanged > 5 or self.errors):
+            print 'Processed %d url%s: %d harvested, %d unchanged, %d error%s' % \
+                  (self.total, '' if self.total == 1 else 's',
+                   self.harvested, self.unchanged, self.errors,
                    '' if self.errors == 1 else 's')
 
-    def harvest_rdf(self, url):
+    def _worker(self):
+        # harvest urls until the queue is empty and no other worker
+        # is still processing a page that might queue related urls
+        while True:
+            with self._lock:
+                while not self.frontier and self._active:
+                    self._lock.wait()
+                if not self.frontier:
+                    return
+                url, depth = self.frontier.pop()
+                self._active += 1
+            try:
+                self.harvest_rdf(url, depth)
+            finally:
+                with self._lock:
+                    self._active -= 1
+                    self._processed()
+                    self._lock.notify_all()
+
+    def _processed(self):
+        # record a url as processed and update progress
+        self.total += 1
+        if self.progress:
+            self.progress.maxval = self.total + len(self.frontier)
+            self.progress.update(self.total)
+
+    def _increment(self, counter):
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def queue_url(self, url, depth=0):
+        # add a url to the queue if not already queued or processed
+        # (and within any depth or host limits);
+        # returns True if the url was queued
+        with self._lock:
+            if self.frontier.add(url, depth):
+                self._lock.notify_all()
+                return True
+        return False
+
+    def harvest_rdf(self, url, depth=0):
+        filename = self.filename_from_url(url)
+        # revalidate any previously harvested copy of this page
+        headers = {'cache-control': 'no-cache'}
+        headers.update(self.cache.conditional_headers(filename))
+
         g = rdflib.Graph()
         try:
-            response = requests.get(url, headers={'cache-control': 'no-cache'})
-            data = g.parse(data=response.content, location=url, format='rdfa')
+            with self.limiter.limit(url):
+                response = self.session.get(url, headers=headers)
+            not_modified = self.cache.not_modified(response)
+            if not not_modified:
+                response.raise_for_status()
+            if not_modified:
+                # page is unchanged since the last harvest, so there is
+                # no need to parse the RDFa or re-save it; load the saved
+                # copy only if we need it to find related urls
+                self.cache.revalidated(filename, response)
+                if not self.find_related:
+                    data = g
+                else:
+                    data = load_graph(filename)
+            else:
+                data = g.parse(data=response.content, publicID=url, format='rdfa')
             # NOTE: this was working previously, and should be fine,
             # but now generates an RDFa parsing error / ascii codec error
             # data = g.parse(location=url, format='rdfa')
         except Exception as err:
             print 'Error attempting to load %s - %s' % (url, err)
-            self.errors += 1
+            self.journal.failed(url, err)
+            self._increment('errors')
             return
 
-        triple_count = len(data)
-        # if no rdf data was found, report and return
-        if triple_count == 0:
-            if self.verbosity >= 1:
-                print 'No RDFa data found in %s' % url
-            return
-        else:
+        self.journal.succeeded(url)
+
+        if not_modified:
             if self.verbosity > 1:
-                print 'Parsed %d triples from %s' % (triple_count, url)
+                print 'Not modified since last harvest: %s' % url
+            self._increment('unchanged')
+        else:
+            triple_count = len(data)
+            # if no rdf data was found, report and return
+            if triple_count == 0:
+                if self.verbosity >= 1:
+                    print 'No RDFa data found in %s' % url
+                return
+            else:
+                if self.verbosity > 1:
+                    print 'Parsed %d triples from %s' % (triple_count, url)
 
-        filename = self.filename_from_url(url)
-        if self.verbosity > 1:
-            print 'Saving as %s' % filename
-        with open(filename, 'w') as datafile:
-            data.serialize(datafile)
-        self.harvested += 1
+            if self.verbosity > 1:
+                print 'Saving as %s' % filename
+            with open(filename, 'w') as datafile:
+                data.serialize(datafile)
+            save_snapshot(filename, data)
+            self.cache.store(filename, url, response)
+            self._increment('harvested')
 
         # if find related is true, look for urls related to this one
         # via either schema.org relatedLink or dcterms:hasPart
@@ -104,8 +244,7 @@ class HarvestRdf(object):
                    (subj, rdflib.OWL.sameAs, rdflib.URIRef(url)) in data:
                     related_url = unicode(obj)
                     # add to queue if not already queued or processed
-                    if related_url not in self.URL_QUEUE or self.PROCESSED_URLS:
-                        self.URL_QUEUE.append(related_url)
+                    if self.queue_url(related_url, depth + 1):
                         queued += 1
 
             # follow all related link relations
@@ -118,8 +257,7 @@ class HarvestRdf(object):
                 # if subj == orig_url or \
                 #    (subj, rdflib.OWL.sameAs, rdflib.URIRef(url)) in data:
                 related_url = unicode(obj)
-                if related_url not in self.URL_QUEUE or self.PROCESSED_URLS:
-                    self.URL_QUEUE.append(related_url)
+                if self.queue_url(related_url, depth + 1):
                     queued += 1
 
         if queued and self.verbosity > 1:
@@ -137,7 +275,48 @@ class HarvestRdf(object):
         filebase = host
         if path:
             filebase += '_%s' % path
-            return os.path.join(self.base_dir, '%s.xml' % filebase)
+        return os.path.join(self.base_dir, '%s.xml' % filebase)
+
+
+class AuthorityIndex(object):
+    # Index of subject and object uris bucketed by authority source,
+    # built in a single pass over the triples of each graph added,
+    # so uris for all sources can be found without querying the
+    # merged data once per source.  Literals whose value is an
+    # authority uri are included, since these sometimes appear in
+    # place of a resource in the harvested data.  Sources are specified
+    # as a list of (name, uri prefix) tuples, as in HarvestRelated.sources.
+
+    def __init__(self, sources):
+        self.sources = list(sources)
+        self.uris = dict((name, set()) for name, prefix in self.sources)
+
+    def source(self, uri):
+        # name of the source a uri belongs to, if any
+        for name, prefix in self.sources:
+            if uri.startswith(prefix):
+                return name
+
+    def add_graph(self, graph, sources=None):
+        # index all uris in a graph, optionally limited to a list of source
+        # names; returns a dictionary of the newly indexed uris by source
+        sources = set(sources) if sources is not None else set(self.uris)
+        new = dict((name, set()) for name in sources)
+        checked = set()
+        for triple in graph:
+            for term in (triple[0], triple[2]):
+                if term in checked or isinstance(term, rdflib.BNode):
+                    continue
+                checked.add(term)
+                name = self.source(term)
+                uri = rdflib.URIRef(term)
+                if name in sources and uri not in self.uris[name]:
+                    self.uris[name].add(uri)
+                    new[name].add(uri)
+        return new
+
+    def __getitem__(self, name):
+        return self.uris[name]
 
 
 class HarvestRelated(object):
@@ -151,86 +330,206 @@ class HarvestRelated(object):
         ('dbpedia', 'http://dbpedia.org/'),
     ]
 
-    def __init__(self, files, basedir):
+    # how long (in seconds) a harvested record is used as-is before the
+    # source is checked for changes; once expired, records are revalidated
+    # with a conditional request and only re-downloaded if changed
+    max_age = {
+        'viaf': 30 * 86400,
+        'geonames': 90 * 86400,
+        'dbpedia': 7 * 86400,
+    }
+
+    # name of the retry journal, relative to the base directory
+    journal_file = '.harvest-related-retry.json'
+
+    def __init__(self, files, basedir, max_age=None, session=None,
+                 workers=1, max_per_host=4, store=None):
+        # store: optional belfastdata.store.PersistentStore; if specified,
+        # input files are loaded into the store (if changed) and
+        # indexed from there rather than parsed individually
         self.files = files
+        self.store = store
         self.basedir = basedir
+        self.cache = HttpCache()
+        self.session = session or HarvestSession(pool_size=max(10, workers))
+        self.journal = RetryJournal(os.path.join(basedir, self.journal_file))
+        if max_age is not None:
+            self.max_age = dict(self.max_age, **max_age)
+        self.workers = max(1, workers)
+        self.limiter = HostLimiter(max_per_host)
 
         self.run()
 
     def run(self):
-        graph = rdflib.Graph()
-
-        # load all files into a single graph so we can query distinct
-        g = rdflib.Graph()
-        for infile in self.files:
-            try:
-                g.parse(infile)
-            except Exception as err:
-                print "Error parsing '%s' as RDF -- %s" % (infile, err)
-                continue
+        # index uris for each source, whether from the input files or from
+        # records harvested from an earlier source
+        self.index = AuthorityIndex(self.sources)
+        self._lock = threading.Lock()
+        # locks by output filename; different uris from the same source
+        # may be saved to the same file (see _harvest_task)
+        self._file_locks = {}
+        self.queue = Queue.Queue()
+        self.processed = 0
 
         for name, url in self.sources:
-            # find anything that is a subject or object and has a
-            # viaf, dbpedia, or geoname uri
-            res = g.query('''
-                SELECT DISTINCT ?uri
-                WHERE {
-                    { ?uri ?p ?o }
-                UNION
-                    { ?s ?p ?uri }
-                FILTER regex(str(?uri), "^%s") .
-                }
-            ''' % url)
-            print '%d %s URI%s' % (len(res), name,
-                                   's' if len(res) != 1 else '')
-
-            if len(res) == 0:
-                continue
-
-            uris = [unicode(r['uri']).encode('ascii', 'ignore') for r in res]
-
             datadir = os.path.join(self.basedir, name)
             if not os.path.isdir(datadir):
                 os.mkdir(datadir)
 
-            if len(uris) >= 5 and ProgressBar and os.isatty(sys.stderr.fileno()):
-                widgets = [Percentage(), ' (', SimpleProgress(), ')',
-                           Bar(), ETA()]
-                progress = ProgressBar(widgets=widgets, maxval=len(uris)).start()
-                processed = 0
-            else:
-                progress = None
+        # find anything in the input files that is a subject or object
+        # and has a viaf, dbpedia, or geoname uri
+        if self.store is not None:
+            self.store.sync(self.files)
+            graphs = self.store.graphs(self.files)
+        else:
+            graphs = self._input_graphs()
+        for g in graphs:
+            new_uris = self.index.add_graph(g)
+            for index, (name, url) in enumerate(self.sources):
+                self._queue_uris(index, new_uris[name])
 
-            for u in uris:
-                # build filename based on URI
-                baseid = u.rstrip('/').split('/')[-1]
+        if self.queue.qsize() >= 5 and ProgressBar and os.isatty(sys.stderr.fileno()):
+            widgets = [Percentage(), ' (', SimpleProgress(), ')',
+                       Bar(), ETA()]
+            self.progress = ProgressBar(widgets=widgets,
+                                        maxval=self.queue.qsize()).start()
+        else:
+            self.progress = None
+
+        # Sources are harvested concurrently rather than one after the other:
+        # uris for later sources found in a harvested record (i.e. dbpedia
+        # records for VIAF persons) are queued as soon as the record is
+        # loaded, so the same records are harvested as when processing
+        # each source in order.
+        if self.workers == 1:
+            while not self.queue.empty():
+                self._run_task(self.queue.get())
+        else:
+            threads = [threading.Thread(target=self._worker)
+                       for i in range(self.workers)]
+            for t in threads:
+                t.daemon = True
+                t.start()
+            self.queue.join()
+            # all uris harvested; signal workers to exit
+            for t in threads:
+                self.queue.put(None)
+            for t in threads:
+                t.join()
+
+        if self.progress:
+            self.progress.finish()
 
-                filename = os.path.join(datadir, '%s.rdf' % baseid)
+        for name, url in self.sources:
+            total = len(self.index[name])
+            print '%d %s URI%s' % (total, name, 's' if total != 1 else '')
 
-                # if already downloaded, don't re-download but add to graph
-                # for any secondary related content
-                if os.path.exists(filename):
-                    # TODO: better refinement would be to use modification
-                    # time on the file to download if changed
-                    # (do all these sources support if-modified-since headers?)
-                    g.parse(location=filename)
+        self.journal.save()
 
-                else:
-                    # Use requests with content negotiation to load the data
-                    data = requests.get(u, headers={'accept': 'application/rdf+xml'})
-                    if data.status_code == requests.codes.ok:
-                        # also add to master graph so we can download related data
-                        # i.e.  dbpedia records for VIAF persons
-                        g.parse(data=data.content)
-
-                        with open(filename, 'w') as datafile:
-                            datafile.write(data.content)
-                    else:
-                        print 'Error loading %s : %s' % (u, data.status_code)
-
-                if progress:
-                    processed += 1
-                    progress.update(processed)
-
-            if progress:
-                progress.finish()
+    def _input_graphs(self):
+        for infile in self.files:
+            try:
+                yield load_graph(infile)
+            except Exception as err:
+                print "Error parsing '%s' as RDF -- %s" % (infile, err)
+
+    def _queue_uris(self, index, uris):
+        # queue newly indexed uris for the source at this index
+        for uri in uris:
+            self.queue.put((index, unicode(uri).encode('ascii', 'ignore')))
+
+    def _worker(self):
+        while True:
+            task = self.queue.get()
+            if task is None:
+                return
+            try:
+                self._run_task(task)
+            finally:
+                self.queue.task_done()
+
+    def _run_task(self, task):
+        # harvest a single uri, reporting any error rather than stopping
+        # the whole run; used by both serial and concurrent harvesting
+        try:
+            self._harvest_task(task)
+        except Exception as err:
+            print 'Error harvesting %s : %s' % (task[1], err)
+
+    def _harvest_task(self, task):
+        index, uri = task
+        name, url = self.sources[index]
+
+        # build filename based on URI
+        baseid = uri.rstrip('/').split('/')[-1]
+        filename = os.path.join(self.basedir, name, '%s.rdf' % baseid)
+
+        # uris that share a last path segment map to the same file, so
+        # only one worker at a time may harvest to a given file (the
+        # content, http cache metadata, and snapshot are written
+        # together); as when harvesting serially, the last one wins
+        with self._file_lock(filename):
+            with self.limiter.limit(uri):
+                doc = self.harvest_uri(uri, filename, self.max_age.get(name))
+
+        # queue related data from any later source
+        # i.e.  dbpedia records for VIAF persons
+        if doc is not None and index + 1 < len(self.sources):
+            later_sources = [n for n, u in self.sources[index + 1:]]
+            with self._lock:
+                new_uris = self.index.add_graph(doc, later_sources)
+            for later in range(index + 1, len(self.sources)):
+                self._queue_uris(later, new_uris[self.sources[later][0]])
+
+        with self._lock:
+            self.processed += 1
+            if self.progress:
+                self.progress.maxval = self.processed + self.queue.qsize()
+                self.progress.update(self.processed)
+
+    def _file_lock(self, filename):
+        with self._lock:
+            if filename not in self._file_locks:
+                self._file_locks[filename] = threading.Lock()
+            return self._file_locks[filename]
+
+    def harvest_uri(self, uri, filename, max_age):
+        # download rdf for a single uri if needed, and return a graph of
+        # its content (whether newly downloaded or previously saved);
+        # returns None if no content is available
+
+        # if recently downloaded, don't check the source
+        # (unless the last attempt to update it failed)
+        if uri not in self.journal and self.cache.is_fresh(filename, max_age):
+            return self._load(filename)
+
+        # Use requests with content negotiation to load the data,
+        # revalidating any previously downloaded copy
+        headers = {'accept': 'application/rdf+xml'}
+        headers.update(self.cache.conditional_headers(filename))
+        try:
+            response = self.session.get(uri, headers=headers)
+            if not self.cache.not_modified(response):
+                response.raise_for_status()
+        except requests.RequestException as err:
+            print 'Error loading %s : %s' % (uri, err)
+            self.journal.failed(uri, err)
+            # fall back to any previously downloaded copy
+            return self._load(filename)
+
+        self.journal.succeeded(uri)
+        if self.cache.not_modified(response):
+            self.cache.revalidated(filename, response)
+            return self._load(filename)
+
+        graph = rdflib.Graph()
+        graph.parse(data=response.content)
+        with open(filename, 'w') as datafile:
+            datafile.write(response.content)
+        self.cache.store(filename, uri, response)
+        save_snapshot(filename, graph)
+        return graph
+
+    def _load(self, filename):
+        if os.path.exists(filename):
+            return load_graph(filename)
@@ -0,0 +1,88 @@
+# conditional GET support for harvested content
+
+import json
+import os
+import time
+from email.utils import formatdate
+
+
+class HttpCache(object):
+    # Keeps HTTP validators (ETag, Last-Modified) and fetch metadata for
+    # each harvested file in a small json sidecar next to the data file,
+    # so that later harvests can send conditional requests and skip
+    # downloading and re-processing content that hasn't changed.
+
+    # suffix for metadata files stored alongside harvested data
+    suffix = '.http.json'
+
+    def metadata_file(self, filename):
+        return '%s%s' % (filename, self.suffix)
+
+    def metadata(self, filename):
+        # cached response metadata for a harvested file, if any
+        try:
+            with open(self.metadata_file(filename)) as metafile:
+                return json.load(metafile)
+        except (IOError, ValueError):
+            return {}
+
+    def last_fetched(self, filename):
+        # time the content was last fetched or confirmed unchanged;
+        # for content harvested before metadata was recorded,
+        # fall back to the file modification time
+        meta = self.metadata(filename)
+        if 'fetched' in meta:
+            return meta['fetched']
+        if os.path.exists(filename):
+            return os.path.getmtime(filename)
+
+    def is_fresh(self, filename, max_age):
+        # true if the file exists and was fetched less than max_age
+        # seconds ago, i.e. the source need not be checked at all
+        if max_age is None or not os.path.exists(filename):
+            return False
+        fetched = self.last_fetched(filename)
+        return fetched is not None and time.time() - fetched < max_age
+
+    def conditional_headers(self, filename):
+        # request headers to revalidate a previously harvested file
+        headers = {}
+        if not os.path.exists(filename):
+            return headers
+        meta = self.metadata(filename)
+        if meta.get('etag'):
+            headers['If-None-Match'] = meta['etag']
+        if meta.get('last_modified'):
+            headers['If-Modified-Since'] = meta['last_modified']
+        elif 'etag' not in headers:
+            # no validators from the server; use the date of our copy
+            headers['If-Modified-Since'] = formatdate(os.path.getmtime(filename),
+                                                      usegmt=True)
+        return headers
+
+    def not_modified(self, response):
+        return response.status_code == 304
+
+    def store(self, filename, url, response):
+        # record validators from a full response after saving its content
+        meta = {
+            'url': url,
+            'fetched': time.time(),
+            'etag': response.headers.get('etag'),
+            'last_modified': response.headers.get('last-modified'),
+            'content_type': response.headers.get('content-type'),
+        }
+        self._write(filename, meta)
+
+    def revalidated(self, filename, response):
+        # record a 304 response; servers may send updated validators
+        meta = self.metadata(filename)
+        meta['fetched'] = time.time()
+        for key, header in [('etag', 'etag'), ('last_modified', 'last-modified')]:
+            if response.headers.get(header):
+                meta[key] = response.headers[header]
+        self._write(filename, meta)
+
+    def _write(self, filename, meta):
+        with open(self.metadata_file(filename), 'w') as metafile:
+            json.dump(meta, metafile, indent=2, sort_keys=True)
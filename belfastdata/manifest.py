@@ -0,0 +1,111 @@
+# track which processing has already been applied to which data files
+
+import hashlib
+import json
+import os
+
+
+class Manifest(object):
+    # Json record of the data files processed by the pipeline: for each
+    # file, a hash of its content and the processing stages (and stage
+    # versions) already applied to that content.  Used to skip files that
+    # have not changed since they were last processed; a file that is
+    # re-harvested or edited gets a new hash and is processed again.
+    #
+    # Stages are identified by class name; a stage class may define a
+    # version attribute, which should be incremented when changes to
+    # the stage mean that previously processed data should be redone.
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.entries = {}
+        if os.path.exists(filename):
+            try:
+                with open(filename) as manifest:
+                    self.entries = json.load(manifest)
+            except ValueError:
+                pass
+
+    @staticmethod
+    def stage_key(stage):
+        return stage.__class__.__name__
+
+    @staticmethod
+    def stage_version(stage):
+        return getattr(stage, 'version', 1)
+
+    def file_hash(self, filename):
+        # content hash for a file; re-uses the recorded hash if the
+        # file size and modification time have not changed
+        return file_hash(filename, self.entries.get(filename))
+
+    def is_current(self, filename, stages):
+        # true if all of the stages have been applied to the
+        # current content of the file
+        entry = self.entries.get(filename)
+        if entry is None or not os.path.exists(filename) or \
+           entry['hash'] != self.file_hash(filename):
+            return False
+        applied = entry.get('stages', {})
+        return all(applied.get(self.stage_key(s)) == self.stage_version(s)
+                   for s in stages)
+
+    def record(self, filename, stages):
+        # record the stages as applied to the current content of the file
+        stat = os.stat(filename)
+        file_hash = self.file_hash(filename)
+        entry = self.entries.get(filename, {})
+        applied = entry.get('stages', {}) if entry.get('hash') == file_hash else {}
+        applied.update((self.stage_key(s), self.stage_version(s)) for s in stages)
+        self.entries[filename] = {
+            'hash': file_hash,
+            'mtime': stat.st_mtime,
+            'size': stat.st_size,
+            'stages': applied,
+        }
+
+    def inputs_hash(self, files):
+        # combined hash of a set of input files, for outputs
+        # generated from more than one file (e.g., gexf)
+        sha1 = hashlib.sha1()
+        for filename in sorted(files):
+            sha1.update('%s %s\n' % (filename, self.file_hash(filename)))
+        return sha1.hexdigest()
+
+    def output_is_current(self, output, files, version=1):
+        # true if an output file exists and was generated from the
+        # current content of the specified input files
+        entry = self.entries.get(output)
+        return entry is not None and os.path.exists(output) and \
+            entry.get('version') == version and \
+            entry.get('inputs') == self.inputs_hash(files)
+
+    def record_output(self, output, files, version=1):
+        self.entries[output] = {
+            'inputs': self.inputs_hash(files),
+            'version': version,
+        }
+
+    def clear(self):
+        # forget all recorded processing, so everything is redone
+        self.entries = {}
+
+    def save(self):
+        with open(self.filename, 'w') as manifest:
+            json.dump(self.entries, manifest, indent=2, sort_keys=True)
+
+
+def file_hash(filename, entry=None):
+    # content hash for a file; re-uses the hash from a previously
+    # recorded entry (with hash, mtime, and size) if the file size
+    # and modification time have not changed
+    stat = os.stat(filename)
+    entry = entry or {}
+    if entry.get('mtime') == stat.st_mtime and entry.get('size') == stat.st_size:
+        return entry['hash']
+
+    sha1 = hashlib.sha1()
+    with open(filename, 'rb') as datafile:
+        for chunk in iter(lambda: datafile.read(65536), ''):
+            sha1.update(chunk)
+    return sha1.hexdigest()
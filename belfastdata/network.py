@@ -0,0 +1,233 @@
+# compact in-memory network representation
+
+from array import array
+from collections import defaultdict
+
+
+class CompactNetwork(object):
+    # Memory-efficient alternative to networkx.MultiDiGraph for large
+    # generated networks.  Nodes are interned to integer ids, and edges
+    # are stored in columnar form as parallel arrays of source id,
+    # target id, label code, and weight, instead of a dictionary of
+    # attributes per edge.  Node attributes are kept in one table per
+    # attribute name (keyed on node id), and attribute values and edge
+    # labels are interned so repeated values are only stored once.
+    #
+    # Supports the subset of the networkx graph api used by
+    # belfastdata.nx.Rdf2Gexf (add_node, add_edge, node attribute
+    # access, nodes_iter/edges_iter); use to_networkx to convert when
+    # the full networkx api is needed.
+
+    def __init__(self):
+        self._node_ids = {}
+        # node key for each node id
+        self.nodes = []
+
+        # edge columns
+        self.sources = array('I')
+        self.targets = array('I')
+        self.label_codes = array('I')
+        self.weights = array('d')
+        # edge labels for each label code
+        self.labels = []
+        self._label_codes = {}
+
+        # node attribute tables: attribute name -> {node id: value code}
+        self.attributes = {}
+        # attribute values for each value code, shared by all attributes
+        self.values = []
+        self._value_codes = {}
+
+        self.node = _NodeMap(self)
+
+    def node_id(self, node):
+        # integer id for a node, adding it if not already present
+        node_id = self._node_ids.get(node)
+        if node_id is None:
+            node_id = self._node_ids[node] = len(self.nodes)
+            self.nodes.append(node)
+        return node_id
+
+    def add_node(self, node, **attrs):
+        node_id = self.node_id(node)
+        for name, value in attrs.iteritems():
+            self.set_attribute(node_id, name, value)
+
+    def add_edge(self, source, target, label=None, weight=1):
+        self.sources.append(self.node_id(source))
+        self.targets.append(self.node_id(target))
+        self.label_codes.append(self._intern(label, self.labels,
+                                             self._label_codes))
+        self.weights.append(weight)
+
+    def set_attribute(self, node_id, name, value):
+        table = self.attributes.get(name)
+        if table is None:
+            table = self.attributes[name] = {}
+        table[node_id] = self._intern(value, self.values, self._value_codes)
+
+    def get_attribute(self, node_id, name):
+        # raises KeyError if the node does not have the attribute
+        return self.values[self.attributes[name][node_id]]
+
+    def node_attributes(self, node_id):
+        # dictionary of all attributes for a single node
+        return dict((name, self.values[table[node_id]])
+                    for name, table in self.attributes.iteritems()
+                    if node_id in table)
+
+    def _intern(self, value, values, codes):
+        code = codes.get(value)
+        if code is None:
+            code = codes[value] = len(values)
+            values.append(value)
+        return code
+
+    def __contains__(self, node):
+        return node in self._node_ids
+
+    def __len__(self):
+        return len(self.nodes)
+
+    def number_of_nodes(self):
+        return len(self.nodes)
+
+    def number_of_edges(self):
+        return len(self.sources)
+
+    def nodes_iter(self, data=False):
+        for node_id, node in enumerate(self.nodes):
+            if data:
+                yield node, self.node[node]
+            else:
+                yield node
+
+    def edges_iter(self, data=False):
+        # edges as (source, target) or (source, target, attributes)
+        for i in xrange(len(self.sources)):
+            source = self.nodes[self.sources[i]]
+            target = self.nodes[self.targets[i]]
+            if data:
+                yield source, target, self.edge_attributes(i)
+            else:
+                yield source, target
+
+    def edge_attributes(self, index):
+        return {'label': self.labels[self.label_codes[index]],
+                'weight': _number(self.weights[index])}
+
+    def to_networkx(self):
+        # convert to an equivalent networkx.MultiDiGraph; networkx is
+        # only loaded when needed, since it is slow to import
+        import networkx as nx
+        graph = nx.MultiDiGraph()
+        for node_id, node in enumerate(self.nodes):
+            graph.add_node(node, **self.node_attributes(node_id))
+        for source, target, attrs in self.edges_iter(data=True):
+            graph.add_edge(source, target, **attrs)
+        return graph
+
+
+def node_attribute_names(network):
+    # sorted names of all node attributes used in a network (networkx
+    # graph or CompactNetwork), except label
+    if isinstance(network, CompactNetwork):
+        names = set(network.attributes)
+    else:
+        names = set()
+        for node, attrs in network.nodes_iter(data=True):
+            names.update(attrs)
+    names.discard('label')
+    return sorted(names)
+
+
+def node_attribute_types(network):
+    # type of each node attribute (except label): 'integer' or 'double'
+    # if all values are numbers of that kind, otherwise 'string'
+    types = {}
+    for node, attrs in network.nodes_iter(data=True):
+        for name, value in attrs.items():
+            if isinstance(value, bool) or \
+               not isinstance(value, (int, long, float)):
+                value_type = 'string'
+            elif isinstance(value, float):
+                value_type = 'double'
+            else:
+                value_type = 'integer'
+            current = types.get(name, value_type)
+            if current != value_type:
+                # mixed integers and floats are doubles; anything else is a string
+                if set([current, value_type]) == set(['integer', 'double']):
+                    value_type = 'double'
+                else:
+                    value_type = 'string'
+            types[name] = value_type
+    types.pop('label', None)
+    return types
+
+
+def aggregate_edges(network):
+    # collapse parallel edges between the same two nodes; returns a
+    # list of source, target, total weight, and a dictionary with the
+    # number of edges for each relation label
+    weights = defaultdict(int)
+    counts = defaultdict(lambda: defaultdict(int))
+    for source, target, attrs in network.edges_iter(data=True):
+        key = (source, target)
+        weights[key] += attrs.get('weight', 1)
+        counts[key][attrs.get('label')] += 1
+    return [(source, target, weights[(source, target)],
+             dict(counts[(source, target)]))
+            for source, target in sorted(weights)]
+
+
+def _number(value):
+    # weights are stored as floats; return whole numbers as int
+    # so output matches a network built with integer weights
+    if value.is_integer():
+        return int(value)
+    return value
+
+
+class _NodeMap(object):
+    # network.node[key] access to node attributes, as in networkx
+
+    def __init__(self, network):
+        self.network = network
+
+    def __getitem__(self, node):
+        return NodeAttributes(self.network, self.network._node_ids[node])
+
+    def __contains__(self, node):
+        return node in self.network
+
+
+class NodeAttributes(object):
+    # dictionary-like view of the attributes of one node
+    # in a CompactNetwork; changes are stored in the network
+
+    def __init__(self, network, node_id):
+        self.network = network
+        self.node_id = node_id
+
+    def __getitem__(self, name):
+        return self.network.get_attribute(self.node_id, name)
+
+    def __setitem__(self, name, value):
+        self.network.set_attribute(self.node_id, name, value)
+
+    def __contains__(self, name):
+        return self.node_id in self.network.attributes.get(name, {})
+
+    def get(self, name, default=None):
+        if name in self:
+            return self[name]
+        return default
+
+    def setdefault(self, name, value):
+        if name not in self:
+            self[name] = value
+        return self[name]
+
+    def items(self):
+        return self.network.node_attributes(self.node_id).items()
@@ -0,0 +1,67 @@
+# normalization of group sheet titles and authors, for smushing
+
+from collections import OrderedDict
+from functools import wraps
+import re
+import unicodedata
+
+
+def lru_cache(maxsize=1024):
+    # decorator to cache results of a function with hashable arguments,
+    # keeping at most maxsize results (least recently used are
+    # discarded first)
+    def decorator(func):
+        cache = OrderedDict()
+
+        @wraps(func)
+        def wrapper(*args):
+            try:
+                result = cache.pop(args)
+            except KeyError:
+                result = func(*args)
+                if len(cache) >= maxsize:
+                    cache.popitem(last=False)
+            # (re-)add as most recently used
+            cache[args] = result
+            return result
+
+        wrapper.cache = cache
+        return wrapper
+    return decorator
+
+
+_non_word = re.compile(r'[^\w\s-]')
+_separators = re.compile(r'[-\s]+')
+
+
+@lru_cache(maxsize=10000)
+def slugify(value):
+    # same result as django.utils.text.slugify, without requiring django:
+    # convert to ascii, remove characters that aren't alphanumerics,
+    # underscores, or hyphens, lowercase, and convert spaces to hyphens
+    value = unicodedata.normalize('NFKD', unicode(value)).encode('ascii', 'ignore').decode('ascii')
+    value = _non_word.sub('', value).strip().lower()
+    return _separators.sub('-', value)
+
+
+def smush_key(author, titles):
+    # identifying text for a group sheet, based on author (uri or
+    # name; None if unknown) and titles; returns None if there is
+    # neither author nor title
+    #
+    # - titles are sorted, so any group sheet with the same titles in
+    #   any order and the same author is considered equivalent
+    # - titles are slugified, to ignore discrepancies in case and punctuation
+    if not titles and not author:
+        return None
+    if author is not None:
+        author = unicode(author)
+    return _smush_key(author, tuple(sorted(unicode(t) for t in titles)))
+
+
+@lru_cache(maxsize=10000)
+def _smush_key(author, titles):
+    if author is None:
+        author = 'anonymous'
+    return u'%s %s' % (author, ' '.join(sorted(slugify(t) for t in titles)))
+
@@ -1,122 +1,261 @@
 
 import glob
-import networkx as nx
-from networkx.readwrite import gexf
 import rdflib
-from rdflib.collection import Collection as RdfCollection
 
+from belfastdata.export import get_exporter, output_format
+from belfastdata.network import CompactNetwork
 from belfastdata.rdfns import SCHEMA_ORG, DC
+from belfastdata.snapshot import load_graph
+from belfastdata.weights import PredicateWeights
 
-# first-pass attempt to generate weighted network based on
-# type of rdf relation
-connection_weights = {
-    'sameAs': 10,
-    'spouse': 9,
-    'founder': 7,
-    'founderOf': 7,
-    'colleague': 4,
-    'member': 5,
-    'memberOf': 5,
-    'knows': 2,
-    'correspondedWith': 2,
-    'publisher': 3,
-    'association': 1,
-    'affiliation': 1,
-    'worksFor': 4,
-    'mentions': 1,
-    'alumniOf': 3,
-
-    'about': 6,
-    'creator': 7,
-    'author': 7,
-    'contributor': 6,
-    'relatedLink': 4,
-    'title': 3,
-    'hasPart': 5,
-
-    'birthPlace': 5,
-    'workLocation': 4,
-    'location': 4,
-    'homeLocation': 4,
-
-}
 
+# deprecated: default weights keyed on edge label, as used before weights
+# were configurable; kept for compatibility only (changes here have no
+# effect; pass a belfastdata.weights.PredicateWeights to Rdf2Gexf instead)
+_default_weights = PredicateWeights()
+connection_weights = dict((_default_weights.label(pred), _default_weights.weight(pred))
+                          for pred in _default_weights.weights)
 
 
 class Rdf2Gexf(object):
 
     # TODO: consider splitting out rdf -> nx logic from nx -> gexf
 
-    def __init__(self, files, outfile):
-        self.outfile = outfile
+    # increment when changes mean existing gexf output should be regenerated
+    version = 2
+
+    def __init__(self, files, outfile, graphs=None, store=None,
+                 compact=False, aggregate=False, label_counts=False,
+                 analytics=None, weights=None):
+        # graphs: optional dictionary of already loaded graphs keyed
+        # on filename (e.g. from a belfastdata.pipeline.Pipeline), to
+        # avoid parsing those files again
+        # store: optional belfastdata.store.PersistentStore to read
+        # from instead of the individual files
+        # compact: build the network as a belfastdata.network.CompactNetwork
+        # instead of a networkx graph, to reduce memory use for large data
+        # aggregate, label_counts: collapse parallel edges in the
+        # output; see belfastdata.gexfwriter.GexfWriter
+        # analytics: optional belfastdata.analytics.NetworkAnalytics, to
+        # add calculated metrics to the nodes before output
+        # weights: optional belfastdata.weights.PredicateWeights for
+        # edge labels and weights; uses the default weights if not specified
+        #
+        # outfile may be a single filename or a list of filenames; the
+        # network is built once and written in the format for each file
+        # (based on extension; see belfastdata.export)
+        if isinstance(outfile, basestring):
+            outfile = [outfile]
+        self.outfiles = outfile
+        # check formats before doing any work
+        for filename in self.outfiles:
+            output_format(filename)
+        self.outfile = self.outfiles[0]
+        if compact:
+            self.network = CompactNetwork()
+        else:
+            # networkx is slow to import, so only load it when used
+            import networkx as nx
+            self.network = nx.MultiDiGraph()
+        self.weights = weights or PredicateWeights()
+
+        # The network is built by streaming triples one document at a
+        # time rather than merging everything into one rdf graph first.
+        # Only the statements needed for node labels (name, title, type,
+        # and title list structure) are kept, and labels are resolved
+        # in a single pass once all the triples have been read.
+        self._names = {}
+        self._titles = {}
+        self._types = {}
+        self._list_first = {}
+        self._list_rest = {}
+        self._lists = {}
+        # subject, blank node pairs for dc:title statements
+        self._title_nodes = set()
+        self._manuscripts = set()
+        # edges already added; the same statement may occur in more
+        # than one file, but should only result in one edge
+        self._edges = set()
+        # edges with a weight that depends on the type of the subject,
+        # which may not have been seen yet; added once all triples are read
+        self._typed_edges = []
+        self._subject_types = {}
+
+        total = 0
+        for triple in self._triples(files, graphs, store):
+            self._add_triple(triple)
+            total += 1
+        print '%d triples in %d files' % (total, len(files))
+
+        self._add_typed_edges()
+        self._resolve_labels()
 
-        self.graph = rdflib.Graph()
-        for infile in files:
-            self.graph.parse(infile)
-        print '%d triples in %d files' % (len(self.graph), len(files))
-
-        self.network = nx.MultiDiGraph()
-        edge_labels = set()
+        print '%d nodes, %d edges' % (self.network.number_of_nodes(),
+                                      self.network.number_of_edges())
 
-        # iterate through rdf triples and add to the graph
-        for triple in self.graph:
-            subj, pred, obj = triple
+        # TODO: useful for verbose output? (also report on relations with no weight?)
+        #print 'edge labels: %s' % ', '.join(set(label for s, o, label
+        #                                     in self.network.edges_iter(data='label')))
+
+        if analytics is not None:
+            analytics.analyze(self.network)
+
+        for filename in self.outfiles:
+            exporter = get_exporter(filename, aggregate=aggregate,
+                                    label_counts=label_counts)
+            exporter.write(self.network, filename)
+
+    def _triples(self, files, graphs=None, store=None):
+        # generate the triples from each file in turn
+        graphs = graphs or {}
+        if store is not None:
+            store.sync(files, graphs)
+            for doc in store.graphs(files):
+                for triple in doc:
+                    yield triple
+            return
 
-            if pred == rdflib.RDF.first or pred == rdflib.RDF.rest:
-                continue
-            # FIXME: iterating through all triples results in
-            # rdf sequences (first/rest) being handled weirdly...
-
-            # make sure subject and object are added to the graph as nodes,
-            # if appropriate
-            self._add_nodes(triple)
-
-            # get the short-hand name for property or edge label
-            name = self._edge_label(pred)
-
-            # if the object is a literal, add it to the node as a property of the subject
-            if subj in self.network and isinstance(obj, rdflib.Literal) \
-               or pred == rdflib.RDF.type:
-                if pred == rdflib.RDF.type:
-                    ns, val = rdflib.namespace.split_uri(obj)
-                    # special case (for now)
-                    if val == 'Manuscript':
-                        if isinstance(self.graph.value(subj, DC.title), rdflib.BNode):
-                            val = 'BelfastGroupSheet'
-
-                else:
-                    val = unicode(obj)
-                self.network.node[subj][name] = val
-
-            # otherwise, add an edge between the two resource nodes
+        for infile in files:
+            if infile in graphs:
+                doc = graphs[infile]
             else:
-                edge_labels.add(name)
-                self.network.add_edge(subj, obj, label=name,
-                                      weight=connection_weights.get(name, 1))
+                doc = load_graph(infile)
+            for triple in doc:
+                yield triple
 
-        print '%d nodes, %d edges' % (self.network.number_of_nodes(),
-                                      self.network.number_of_edges())
+    def _add_triple(self, triple):
+        # add a single rdf triple to the network
+        subj, pred, obj = triple
 
-        # TODO: useful for verbose output? (also report on relations with no weight?)
-        #print 'edge labels: %s' % ', '.join(edge_labels)
+        # buffer statements used to generate node labels
+        if pred == rdflib.RDF.first:
+            self._list_first.setdefault(subj, obj)
+        elif pred == rdflib.RDF.rest:
+            self._list_rest.setdefault(subj, obj)
+        elif pred == SCHEMA_ORG.name:
+            self._names.setdefault(subj, obj)
+        elif pred == DC.title:
+            self._titles.setdefault(subj, obj)
+        elif pred == rdflib.RDF.type:
+            self._types.setdefault(subj, obj)
+            if obj in self.weights.types:
+                self._subject_types.setdefault(subj, []).append(obj)
+
+        # rdf sequences (first/rest) are only used for labels,
+        # not included in the network
+        if pred == rdflib.RDF.first or pred == rdflib.RDF.rest:
+            return
+
+        # make sure subject and object are added to the graph as nodes,
+        # if appropriate
+        self._add_nodes(triple)
+
+        # a title list is not a node in the network; the titles are
+        # added to the subject as an attribute once lists are collected
+        if pred == DC.title and isinstance(obj, rdflib.BNode):
+            self._title_nodes.add((subj, obj))
+            return
 
-        gexf.write_gexf(self.network, self.outfile)
+        # get the short-hand name for property or edge label
+        name = self.weights.label(pred)
+
+        # if the object is a literal, add it to the node as a property of the subject
+        if isinstance(obj, rdflib.Literal) or pred == rdflib.RDF.type:
+            if pred == rdflib.RDF.type:
+                val = self.weights.label(obj)
+                # special case (for now); manuscripts with a title list
+                # are group sheets, but the title may not have been seen yet
+                if val == 'Manuscript':
+                    self._manuscripts.add(subj)
+            else:
+                val = unicode(obj)
+            self.network.node[subj][name] = val
+
+        # otherwise, add an edge between the two resource nodes
+        elif triple not in self._edges:
+            self._edges.add(triple)
+            if self.weights.is_typed(pred):
+                self._typed_edges.append(triple)
+            else:
+                self.network.add_edge(subj, obj, label=name,
+                                      weight=self.weights.weight(pred))
+
+    def _add_typed_edges(self):
+        # add edges weighted by subject type, now that all types are known
+        for subj, pred, obj in self._typed_edges:
+            self.network.add_edge(subj, obj, label=self.weights.label(pred),
+                                  weight=self.weights.weight(
+                                      pred, self._subject_types.get(subj)))
+        self._typed_edges, self._subject_types = [], {}
+
+    def _collect_lists(self):
+        # convert buffered rdf:first/rdf:rest statements into python
+        # lists of items, keyed on the first node of each list; each
+        # list node is visited once, so this is linear in the number
+        # of list statements
+        tails = set(self._list_rest.itervalues())
+        visited = set()
+        self._lists = {}
+        for head in self._list_first:
+            if head in tails:
+                continue
+            items = []
+            node = head
+            while node in self._list_first and node not in visited:
+                visited.add(node)
+                items.append(self._list_first[node])
+                node = self._list_rest.get(node)
+            self._lists[head] = items
+        self._list_first, self._list_rest = {}, {}
+
+    def _add_title_lists(self):
+        # add titles from title lists as a node attribute of the subject;
+        # a blank node title with statements of its own (i.e., not a
+        # list) is added as an ordinary edge, and one with no statements
+        # at all (an empty list) is ignored
+        name = self.weights.label(DC.title)
+        for subj, title in self._title_nodes:
+            if title in self._lists:
+                self.network.node[subj][name] = '; '.join(self._lists[title])
+            elif title in self.network:
+                self.network.add_edge(subj, title, label=name,
+                                      weight=self.weights.weight(DC.title))
+        self._title_nodes = set()
+
+    def _resolve_labels(self):
+        # set labels for all nodes, once all triples have been added
+        self._collect_lists()
+        self._add_title_lists()
+        for res, attrs in self.network.nodes_iter(data=True):
+            label = self._node_label(res)
+            # label from the data (e.g. rdfs:label), if any, takes precedence
+            if label is not None:
+                attrs.setdefault('label', label)
+
+        for res in self._manuscripts:
+            if self.network.node[res].get('type') == 'Manuscript' and \
+               self._titles.get(res) in self._lists:
+                self.network.node[res]['type'] = 'BelfastGroupSheet'
+
+        # buffered statements are no longer needed
+        self._names, self._titles, self._types = {}, {}, {}
+        self._lists = {}
+        self._manuscripts, self._edges = set(), set()
 
     def _node_label(self, res):
         # NOTE: consider adding/calculating a preferredlabel
         # for important nodes in our data
 
         # use name first, if we have one
-        name = self.graph.value(res, SCHEMA_ORG.name)
+        name = self._names.get(res)
         if name:
             return name
 
-        title = self.graph.value(res, DC.title)
+        title = self._titles.get(res)
         if title:
             # if title is a bnode, convert from list/collection
             if isinstance(title, rdflib.BNode):
-                title_list = RdfCollection(self.graph, title)
-                title = 'group sheet: ' + '; '.join(title_list)
+                title = 'group sheet: ' + '; '.join(self._lists.get(title, []))
                 # truncate list if too long
                 if len(title) > 50:
                     title = title[:50] + ' ...'
@@ -126,15 +265,9 @@ class Rdf2Gexf(object):
             return title
 
         # as a fall-back, use type for a label
-        type = self.graph.value(res, rdflib.RDF.type)
+        type = self._types.get(res)
         if type:
-            ns, short_type = rdflib.namespace.split_uri(type)
-            return short_type
-
-    def _edge_label(self, pred):
-        # get the short-hand name for property or edge label
-        ns, name = rdflib.namespace.split_uri(pred)
-        return name
+            return self.weights.label(type)
 
     def _add_nodes(self, triple):
         subj, pred, obj = triple
@@ -157,10 +290,7 @@ class Rdf2Gexf(object):
             return True
 
     def _add_node(self, res):
-        # add an rdf term to the network as a node
-        attrs = {}
-        label = self._node_label(res)
-        if label is not None:
-            attrs['label'] = label
-        self.network.add_node(res, **attrs)
+        # add an rdf term to the network as a node; labels are
+        # added once all triples have been read
+        self.network.add_node(res)
 
@@ -0,0 +1,188 @@
+# run multiple processing steps over rdf data, loading each file once
+
+from collections import OrderedDict
+import multiprocessing
+import os
+import sys
+from StringIO import StringIO
+import rdflib
+
+from belfastdata.snapshot import load_graph, save_snapshot
+
+try:
+    from progressbar import ProgressBar, Bar, Percentage, ETA, SimpleProgress
+except ImportError:
+    ProgressBar = None
+
+
+class Pipeline(object):
+    # Runs a series of per-document stages over a set of rdf files.
+    # Each file is loaded once (from a belfastdata.snapshot binary
+    # snapshot where possible), the in-memory graphs are passed through
+    # every stage in order, and each file that any stage modified is
+    # written out once at the end, instead of every stage parsing and
+    # re-serializing the entire dataset.
+    #
+    # Stages are objects with a process_graph(graph, filename) method
+    # that returns the updated graph (which may be a new graph object)
+    # if the document was changed, or None if it was not; e.g. the
+    # stages in belfastdata.clean.  Stages may also provide a
+    # process_graphs(graphs) method, which is given all loaded documents
+    # at once (as an ordered dictionary keyed on filename) and returns a
+    # dictionary of the documents it changed.
+    #
+    # If jobs is more than 1, files are processed in a pool of worker
+    # processes, each running all stages over one document at a time.
+    # Output from the stages is collected and reported in file order.
+    # Unless keep_graphs is False, the processed graphs are sent back
+    # to the main process for use by subsequent steps.
+    #
+    # If a belfastdata.manifest.Manifest is specified, files that all
+    # stages have already been applied to (and have not changed since)
+    # are skipped entirely, and the manifest is updated for processed files.
+
+    def __init__(self, files, stages=None, jobs=1, keep_graphs=True,
+                 manifest=None):
+        self.files = files
+        self.stages = stages or []
+        self.jobs = jobs
+        self.keep_graphs = keep_graphs
+        self.manifest = manifest
+        self.graphs = OrderedDict()
+        self.modified = set()
+
+    def pending(self):
+        # files that need to be processed
+        if self.manifest is None:
+            return list(self.files)
+        return [f for f in self.files
+                if not self.manifest.is_current(f, self.stages)]
+
+    def load(self):
+        for filename in self.pending():
+            try:
+                g = load_graph(filename)
+            except Exception as err:
+                print "Error parsing '%s' as RDF -- %s" % (filename, err)
+                continue
+            self.graphs[filename] = g
+
+    def run(self):
+        # load, process, and save; returns the processed graphs
+        # keyed on filename, for use by subsequent steps
+        if self.jobs > 1:
+            self._run_parallel()
+            return self.graphs
+
+        if not self.graphs:
+            self.load()
+
+        for stage in self.stages:
+            self.process(stage)
+
+        self.save()
+        return self.graphs
+
+    def process(self, stage):
+        # run a single stage over all loaded documents
+        if hasattr(stage, 'process_graphs'):
+            outputs = stage.process_graphs(self.graphs)
+        else:
+            outputs = {}
+            for filename, graph in self.graphs.iteritems():
+                output = stage.process_graph(graph, filename)
+                if output is not None:
+                    outputs[filename] = output
+        for filename, output in outputs.iteritems():
+            self.graphs[filename] = output
+            self.modified.add(filename)
+
+    def save(self):
+        # write out all modified documents, replacing the original files
+        for filename, graph in self.graphs.iteritems():
+            if filename in self.modified:
+                with open(filename, 'w') as datafile:
+                    graph.serialize(datafile)
+                save_snapshot(filename, graph)
+        self.modified.clear()
+        self._record(self.graphs.keys())
+
+    def _record(self, files):
+        # update the manifest for processed files
+        if self.manifest is None:
+            return
+        for filename in files:
+            self.manifest.record(filename, self.stages)
+        self.manifest.save()
+
+    def _run_parallel(self):
+        files = self.pending()
+        pool = multiprocessing.Pool(self.jobs, _init_worker,
+                                    (self.stages, self.keep_graphs))
+        if len(files) >= 5 and ProgressBar and os.isatty(sys.stderr.fileno()):
+            widgets = [Percentage(), ' (', SimpleProgress(), ')',
+                       Bar(), ETA()]
+            progress = ProgressBar(widgets=widgets,
+                                   maxval=len(files)).start()
+        else:
+            progress = None
+
+        try:
+            # imap returns results in file order, so output is
+            # reported consistently regardless of which worker finishes first
+            results = pool.imap(_process_file, files)
+            for processed, (filename, output, ok, data) in enumerate(results):
+                if not ok:
+                    files.remove(filename)
+                if output:
+                    sys.stdout.write(output)
+                if data is not None:
+                    namespaces, triples = data
+                    g = rdflib.Graph()
+                    for prefix, ns in namespaces:
+                        g.bind(prefix, ns)
+                    for triple in triples:
+                        g.add(triple)
+                    self.graphs[filename] = g
+                if progress:
+                    progress.update(processed + 1)
+        finally:
+            pool.close()
+            pool.join()
+
+        if progress:
+            progress.finish()
+        self._record(files)
+
+
+# state for pipeline worker processes
+_worker_stages = []
+_worker_keep_graphs = True
+
+
+def _init_worker(stages, keep_graphs):
+    global _worker_stages, _worker_keep_graphs
+    _worker_stages = stages
+    _worker_keep_graphs = keep_graphs
+
+
+def _process_file(filename):
+    # run all stages over a single file in a worker process; returns
+    # filename, any output from the stages, whether processing succeeded,
+    # and the namespaces and triples of the processed graph (if requested)
+    stdout = sys.stdout
+    sys.stdout = output = StringIO()
+    ok = False
+    data = None
+    try:
+        pipeline = Pipeline([filename], _worker_stages)
+        pipeline.run()
+        ok = filename in pipeline.graphs
+        if ok and _worker_keep_graphs:
+            g = pipeline.graphs[filename]
+            data = (list(g.namespaces()), list(g))
+    except Exception as err:
+        print 'Error processing %s -- %s' % (filename, err)
+    finally:
+        sys.stdout = stdout
+    return filename, output.getvalue(), ok, data
@@ -1,13 +1,23 @@
+import multiprocessing
 import re
 import os.path
+import lxml.html
 import rdflib
 from rdflib.collection import Collection as RdfCollection
-from bs4 import BeautifulSoup
 
 from belfastdata import rdfns
 
 
 class QUB(object):
+    # Converts the Queen's University Belfast description of their Belfast
+    # Group collection (HTML converted from a PDF) to RDF, with a blank
+    # node for each typescript and its author, titles, date, etc.
+    #
+    # Takes one or more HTML files, each saved as an .xml file of the
+    # same name; if jobs is more than 1, files are converted in a pool
+    # of worker processes.  HTML is parsed with lxml.  Other catalogue
+    # listings in the same format can be converted by subclassing
+    # and overriding the collection uri and known name uris.
 
     # regex to grab names from description
     NAME_REGEX = re.compile('(?P<last>[A-Z][a-zA-Z]+), (?P<first>[A-Z][a-z. ]+)')
@@ -54,9 +64,48 @@ class QUB(object):
     #   Harvey, W.J.
     #   Johnston, J. K.
 
-    def __init__(self, file, output_dir=None, verbosity=1):
-        htmlfile = open(file)
-        doc = BeautifulSoup(htmlfile)
+    def __init__(self, files=None, output_dir=None, verbosity=1, jobs=1):
+        # files may be a single filename or a list
+        self.output_dir = output_dir
+        self.verbosity = verbosity
+        if isinstance(files, basestring):
+            files = [files]
+        files = files or []
+
+        if jobs > 1 and len(files) > 1:
+            pool = multiprocessing.Pool(jobs)
+            try:
+                # results are reported in file order
+                filenames = pool.imap(_convert_file, [(self, f) for f in files])
+                for filename in filenames:
+                    self._report(filename)
+            finally:
+                pool.close()
+                pool.join()
+        else:
+            for f in files:
+                self._report(self.convert_file(f))
+
+    def _report(self, filename):
+        if self.verbosity >= 1:
+            print 'Saving as %s' % filename
+
+    def convert_file(self, file):
+        # convert a single html file and save the rdf; returns
+        # the name of the file that was written
+        g = self.to_rdf(lxml.html.parse(file).getroot())
+
+        # use input filename as base, but generate as .xml in current directory
+        basename, ext = os.path.splitext(os.path.basename(file))
+        filename = '%s.xml' % basename
+        if self.output_dir is not None:
+            filename = os.path.join(self.output_dir, filename)
+        with open(filename, 'w') as datafile:
+            g.serialize(datafile)
+        return filename
+
+    def to_rdf(self, doc):
+        # generate an rdf graph for a parsed html document
         g = rdflib.Graph()
         # bind namespace prefixes for output
         g.bind('schema', rdfns.SCHEMA_ORG)
@@ -68,110 +117,124 @@ class QUB(object):
         for t in [rdfns.ARCH.Collection, rdfns.SCHEMA_ORG.CreativeWork,
                   rdfns.DCMITYPE.Collection]:
             g.add((coll, rdflib.RDF.type, t))
-            g.add((coll, rdfns.SCHEMA_ORG.name, rdflib.Literal(doc.body.h1.text)))
-            g.add((coll, rdfns.SCHEMA_ORG.description, rdflib.Literal(doc.body.find(id='about').text)))
-            g.add((coll, rdfns.SCHEMA_ORG.about, rdflib.URIRef(self.NAME_URIS['Belfast Group'])))
+        g.add((coll, rdfns.SCHEMA_ORG.name,
+               rdflib.Literal(_text(doc.body.find('.//h1')))))
+        g.add((coll, rdfns.SCHEMA_ORG.description,
+               rdflib.Literal(_text(doc.get_element_by_id('about')))))
+        g.add((coll, rdfns.SCHEMA_ORG.about, rdflib.URIRef(self.NAME_URIS['Belfast Group'])))
 
         # TODO: add information about owning archive ?
         # queen's u belfast mentions some collections are in archives hub... doesn't seem to include this one
         # possibly relevant? http://archiveshub.ac.uk/data/gb247-msgen874-875  (hobsbaum at glasgow)
 
-        for div in doc.find_all('div'):
-            # only include typescript content (should be all but one)
-            if 'Typescript' not in div.text:
-                continue
-
-            # create a blank node for the manuscript object
-            msnode = rdflib.BNode()
-            g.add((coll, rdfns.SCHEMA_ORG.mentions, msnode))
-            g.add((msnode, rdflib.RDF.type, rdfns.BIBO.Manuscript))
-
-            content = list(div.stripped_strings)
-            first_line = content[0]
-            # first line should start with the author's name (if known)
-            # FIXME: a few have multiple authors
-            name_match = self.NAME_REGEX.match(first_line)
-            if name_match:
-                last_name = name_match.group('last').strip()
-                first_name = name_match.group('first').strip()
-                name_key = '%s, %s' % (last_name, first_name)
-                full_name = '%s %s' % (first_name, last_name)
-
-                # use known URI if possible
-                if name_key in self.NAME_URIS:
-                    author = rdflib.URIRef(self.NAME_URIS[name_key])
-                else:
-                    author = rdflib.BNode()
-
-                # relate person to manuscript as author, include name information
-                g.add((msnode, rdfns.SCHEMA_ORG.author, author))
-                g.add((author, rdfns.rdflib.RDF.type, rdfns.SCHEMA_ORG.Person))
-                g.add((author, rdfns.SCHEMA_ORG.name, rdflib.Literal(full_name)))
-                g.add((author, rdfns.SCHEMA_ORG.familyName, rdflib.Literal(last_name)))
-                g.add((author, rdfns.SCHEMA_ORG.givenName, rdflib.Literal(first_name)))
-
-            # A *few* items include a date; add it to the RDF when present
-            last_line = content[-1]
-            if 'Undated' not in last_line:
-                date_match = self.DATE_REGEX.match(last_line)
-                date = None
-                if date_match:
-                    date = '%s-%s-%s' % (date_match.group('year'),
-                                         date_match.group('month'),
-                                         date_match.group('day'))
-                else:
-                    year_match = self.YEAR_REGEX.match(last_line)
-                    if year_match:
-                        date = year_match.group('year')
-
-                if date is not None:
-                    # NOTE: using dc:date since it's not clear what date this would be
-                    # (not necessarily a publication/creation date, e.g. one of the more specific schema.org)
-                    g.add((msnode, rdfns.DC.date, rdflib.Literal(date)))
-
-            # collection desription includes notes about poetry, short story, etc.
-            # including as genre to avoid losing information
-            if 'poem' in first_line.lower():
-                g.add((msnode, rdfns.SCHEMA_ORG.genre, rdflib.Literal('poetry')))
-            elif 'short story' in div.text.lower() or 'short stories' in div.text.lower():
-                g.add((msnode, rdfns.SCHEMA_ORG.genre, rdflib.Literal('short story')))
-            # one case is a book chapter...
-            # some marked as possible translations?
-
-            # collection description includes number of pages for each; go ahead and include
-            pages = self.PAGES_REGEX.search(div.text)
-            if pages:
-                g.add((msnode, rdfns.BIBO.numPages, rdflib.Literal(pages.group('num'))))
-
-            titles = []
-            for italic_text in div.find_all('i'):
-                for title in italic_text.stripped_strings:
-                    # qub titles include subtitles/dedications in parenthesis,
-                    # and "(sic)" in a few places,
-                    # which makes de-duping difficult because titles look different.
-                    # remove anything in parenthesis, including nested parens
-                    while '(' in title:
-                        title = self.PAREN_REGEX.sub('', title)
-
-                    titles.append(title)
-
-            # if only one title, no parts
-            if len(titles) == 1:
-                title = rdflib.Literal(titles[0])
-                g.add((msnode, rdfns.DC.title, title))
-            # multiple titles; use rdf sequence to preserve order
+        for div in doc.iter('div'):
+            self.add_manuscript(g, coll, div)
+        return g
+
+    def add_manuscript(self, g, coll, div):
+        # add the manuscript described in a single div, if any
+        text = _text(div)
+        # only include typescript content (should be all but one)
+        if 'Typescript' not in text:
+            return
+
+        # create a blank node for the manuscript object
+        msnode = rdflib.BNode()
+        g.add((coll, rdfns.SCHEMA_ORG.mentions, msnode))
+        g.add((msnode, rdflib.RDF.type, rdfns.BIBO.Manuscript))
+
+        content = _stripped_strings(div)
+        first_line = content[0]
+        # first line should start with the author's name (if known)
+        # FIXME: a few have multiple authors
+        name_match = self.NAME_REGEX.match(first_line)
+        if name_match:
+            last_name = name_match.group('last').strip()
+            first_name = name_match.group('first').strip()
+            name_key = '%s, %s' % (last_name, first_name)
+            full_name = '%s %s' % (first_name, last_name)
+
+            # use known URI if possible
+            if name_key in self.NAME_URIS:
+                author = rdflib.URIRef(self.NAME_URIS[name_key])
             else:
-                title_node = rdflib.BNode()
-                title_coll = RdfCollection(g, title_node,
-                                           [rdflib.Literal(t) for t in titles])
-                g.add((msnode, rdfns.DC.title, title_node))
-
-        # use input filename as base, but generate as .xml in current directory
-        basename, ext = os.path.splitext(os.path.basename(file))
-        filename = '%s.xml' % basename
-        if output_dir is not None:
-            filename = os.path.join(output_dir, filename)
-        if verbosity >= 1:
-            print 'Saving as %s' % filename
-        with open(filename, 'w') as datafile:
-            g.serialize(datafile)
+                author = rdflib.BNode()
+
+            # relate person to manuscript as author, include name information
+            g.add((msnode, rdfns.SCHEMA_ORG.author, author))
+            g.add((author, rdflib.RDF.type, rdfns.SCHEMA_ORG.Person))
+            g.add((author, rdfns.SCHEMA_ORG.name, rdflib.Literal(full_name)))
+            g.add((author, rdfns.SCHEMA_ORG.familyName, rdflib.Literal(last_name)))
+            g.add((author, rdfns.SCHEMA_ORG.givenName, rdflib.Literal(first_name)))
+
+        # A *few* items include a date; add it to the RDF when present
+        last_line = content[-1]
+        if 'Undated' not in last_line:
+            date_match = self.DATE_REGEX.match(last_line)
+            date = None
+            if date_match:
+                date = '%s-%s-%s' % (date_match.group('year'),
+                                     date_match.group('month'),
+                                     date_match.group('day'))
+            else:
+                year_match = self.YEAR_REGEX.match(last_line)
+                if year_match:
+                    date = year_match.group('year')
+
+            if date is not None:
+                # NOTE: using dc:date since it's not clear what date this would be
+                # (not necessarily a publication/creation date, e.g. one of the more specific schema.org)
+                g.add((msnode, rdfns.DC.date, rdflib.Literal(date)))
+
+        # collection desription includes notes about poetry, short story, etc.
+        # including as genre to avoid losing information
+        lower_text = text.lower()
+        if 'poem' in first_line.lower():
+            g.add((msnode, rdfns.SCHEMA_ORG.genre, rdflib.Literal('poetry')))
+        elif 'short story' in lower_text or 'short stories' in lower_text:
+            g.add((msnode, rdfns.SCHEMA_ORG.genre, rdflib.Literal('short story')))
+        # one case is a book chapter...
+        # some marked as possible translations?
+
+        # collection description includes number of pages for each; go ahead and include
+        pages = self.PAGES_REGEX.search(text)
+        if pages:
+            g.add((msnode, rdfns.BIBO.numPages, rdflib.Literal(pages.group('num'))))
+
+        titles = []
+        for italic_text in div.iter('i'):
+            for title in _stripped_strings(italic_text):
+                # qub titles include subtitles/dedications in parenthesis,
+                # and "(sic)" in a few places,
+                # which makes de-duping difficult because titles look different.
+                # remove anything in parenthesis, including nested parens
+                while '(' in title:
+                    title = self.PAREN_REGEX.sub('', title)
+
+                titles.append(title)
+
+        # if only one title, no parts
+        if len(titles) == 1:
+            title = rdflib.Literal(titles[0])
+            g.add((msnode, rdfns.DC.title, title))
+        # multiple titles; use rdf sequence to preserve order
+        else:
+            title_node = rdflib.BNode()
+            RdfCollection(g, title_node, [rdflib.Literal(t) for t in titles])
+            g.add((msnode, rdfns.DC.title, title_node))
+
+
+def _text(element):
+    # all text within an html element
+    return unicode(element.text_content())
+
+
+def _stripped_strings(element):
+    # non-empty strings within an html element, with whitespace stripped
+    return [unicode(s).strip() for s in element.itertext() if s.strip()]
+
+
+def _convert_file(args):
+    # convert a single file in a worker process
+    converter, file = args
+    return converter.convert_file(file)
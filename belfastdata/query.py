@@ -0,0 +1,265 @@
+# queries on a generated network, using a persisted adjacency index
+
+from array import array
+from collections import deque
+import cPickle as pickle
+import gzip
+
+from belfastdata.network import CompactNetwork
+
+
+class AdjacencyIndex(object):
+    # Compact, persistent index of a generated network, for answering
+    # queries (ego networks, shortest paths) without rebuilding the
+    # network from rdf.  Written like any other network output format
+    # (see belfastdata.export), e.g. rdf2gexf -o belfastgroup.netidx,
+    # and loaded with AdjacencyIndex.load(filename).
+    #
+    # Nodes are numbered, and stored with their label and type only.
+    # Outgoing and incoming edges are stored in compressed sparse row
+    # form: for each direction, an array of offsets into parallel arrays
+    # of neighbor ids, label codes, and weights, so the edges for a node
+    # are a contiguous slice.
+
+    # increment if the index format changes
+    format_version = 1
+
+    def __init__(self):
+        self.nodes = []
+        self.node_labels = []
+        self.node_types = []
+        self.edge_labels = []
+        self._node_ids = None
+        self.out_edges = _EdgeTable()
+        self.in_edges = _EdgeTable()
+
+    @classmethod
+    def from_network(cls, network):
+        # build an index for a networkx graph or CompactNetwork
+        index = cls()
+        ids = {}
+        for node, attrs in network.nodes_iter(data=True):
+            ids[node] = len(index.nodes)
+            index.nodes.append(unicode(node))
+            label = attrs.get('label')
+            index.node_labels.append(unicode(label) if label is not None else None)
+            node_type = attrs.get('type')
+            index.node_types.append(unicode(node_type) if node_type is not None else None)
+
+        label_codes = {}
+        edges = []
+        for source, target, attrs in network.edges_iter(data=True):
+            label = attrs.get('label')
+            if label not in label_codes:
+                label_codes[label] = len(index.edge_labels)
+                index.edge_labels.append(label)
+            edges.append((ids[source], ids[target], label_codes[label],
+                          attrs.get('weight', 1)))
+
+        n = len(index.nodes)
+        index.out_edges = _EdgeTable.build(n, edges)
+        index.in_edges = _EdgeTable.build(n, ((t, s, l, w) for s, t, l, w in edges))
+        return index
+
+    def save(self, filename):
+        data = {
+            'nodes': self.nodes,
+            'node_labels': self.node_labels,
+            'node_types': self.node_types,
+            'edge_labels': self.edge_labels,
+            'out_edges': self.out_edges.dump(),
+            'in_edges': self.in_edges.dump(),
+        }
+        with _open(filename, 'wb') as indexfile:
+            pickle.dump({'version': self.format_version}, indexfile,
+                        pickle.HIGHEST_PROTOCOL)
+            pickle.dump(data, indexfile, pickle.HIGHEST_PROTOCOL)
+
+    @classmethod
+    def load(cls, filename):
+        with _open(filename, 'rb') as indexfile:
+            header = pickle.load(indexfile)
+            if header.get('version') != cls.format_version:
+                raise ValueError('%s is not a current network index; please regenerate it'
+                                 % filename)
+            data = pickle.load(indexfile)
+        index = cls()
+        index.nodes = data['nodes']
+        index.node_labels = data['node_labels']
+        index.node_types = data['node_types']
+        index.edge_labels = data['edge_labels']
+        index.out_edges = _EdgeTable.restore(data['out_edges'])
+        index.in_edges = _EdgeTable.restore(data['in_edges'])
+        return index
+
+    def __len__(self):
+        return len(self.nodes)
+
+    def node_id(self, node):
+        # id for a node uri; raises KeyError if not in the network
+        if self._node_ids is None:
+            self._node_ids = dict((n, i) for i, n in enumerate(self.nodes))
+        return self._node_ids[unicode(node)]
+
+    def find(self, text, exact=False):
+        # ids of nodes whose uri or label contains the text, or with
+        # exact=True, whose label is the text (case-insensitive)
+        text = ' '.join(text.lower().split())
+        if exact:
+            return [i for i, label in enumerate(self.node_labels)
+                    if label and ' '.join(label.lower().split()) == text]
+        return [i for i, (node, label) in enumerate(zip(self.nodes, self.node_labels))
+                if text in node.lower() or (label and text in label.lower())]
+
+    def label_codes(self, labels):
+        # codes for a list of edge labels, for filtering; None for no filter
+        if not labels:
+            return None
+        return set(i for i, label in enumerate(self.edge_labels) if label in labels)
+
+    def neighbors(self, node_id, labels=None, direction='both'):
+        # generate neighbor id, edge label, weight, and direction
+        # ('out' or 'in') for the edges of a node, optionally
+        # restricted to a list of edge labels
+        return self._neighbors(node_id, self.label_codes(labels), direction)
+
+    def _neighbors(self, node_id, codes, direction='both'):
+        tables = []
+        if direction in ('both', 'out'):
+            tables.append(('out', self.out_edges))
+        if direction in ('both', 'in'):
+            tables.append(('in', self.in_edges))
+        for edge_dir, table in tables:
+            for i in xrange(table.offsets[node_id], table.offsets[node_id + 1]):
+                if codes is None or table.labels[i] in codes:
+                    yield table.targets[i], self.edge_labels[table.labels[i]], \
+                        table.weights[i], edge_dir
+
+    def ego(self, node_id, depth=1, labels=None, direction='both'):
+        # nodes within depth steps of a node; returns a dictionary
+        # of node id -> distance
+        codes = self.label_codes(labels)
+        distances = {node_id: 0}
+        queue = deque([node_id])
+        while queue:
+            current = queue.popleft()
+            if distances[current] >= depth:
+                continue
+            for neighbor, label, weight, edge_dir in \
+                    self._neighbors(current, codes, direction):
+                if neighbor not in distances:
+                    distances[neighbor] = distances[current] + 1
+                    queue.append(neighbor)
+        return distances
+
+    def shortest_path(self, source_id, target_id, labels=None):
+        # fewest-steps path between two nodes, ignoring edge direction;
+        # returns a list of (node id, edge label from the previous node),
+        # or None if the nodes are not connected
+        codes = self.label_codes(labels)
+        previous = {source_id: None}
+        queue = deque([source_id])
+        while queue and target_id not in previous:
+            current = queue.popleft()
+            for neighbor, label, weight, edge_dir in self._neighbors(current, codes):
+                if neighbor not in previous:
+                    previous[neighbor] = (current, label)
+                    queue.append(neighbor)
+        if target_id not in previous:
+            return None
+
+        path = []
+        node = target_id
+        while node is not None:
+            step = previous[node]
+            path.append((node, step[1] if step else None))
+            node = step[0] if step else None
+        path.reverse()
+        return path
+
+    def subgraph(self, node_ids, labels=None):
+        # CompactNetwork with the specified nodes and the edges
+        # between them, e.g. for export with belfastdata.export
+        codes = self.label_codes(labels)
+        network = CompactNetwork()
+        node_ids = set(node_ids)
+        for node_id in sorted(node_ids):
+            attrs = {}
+            if self.node_labels[node_id] is not None:
+                attrs['label'] = self.node_labels[node_id]
+            if self.node_types[node_id] is not None:
+                attrs['type'] = self.node_types[node_id]
+            network.add_node(self.nodes[node_id], **attrs)
+        for node_id in sorted(node_ids):
+            for neighbor, label, weight, edge_dir in \
+                    self._neighbors(node_id, codes, direction='out'):
+                if neighbor in node_ids:
+                    network.add_edge(self.nodes[node_id], self.nodes[neighbor],
+                                     label=label, weight=weight)
+        return network
+
+    def describe(self, node_id):
+        # display name for a node
+        label = self.node_labels[node_id]
+        if label:
+            return u'%s <%s>' % (' '.join(label.split()), self.nodes[node_id])
+        return u'<%s>' % self.nodes[node_id]
+
+
+class _EdgeTable(object):
+    # edges for one direction, in compressed sparse row form
+
+    def __init__(self):
+        self.offsets = array('I', [0])
+        self.targets = array('I')
+        self.labels = array('I')
+        self.weights = array('d')
+
+    @classmethod
+    def build(cls, num_nodes, edges):
+        # build from a list of source, target, label code, weight
+        edges = sorted(edges)
+        table = cls()
+        table.offsets = array('I', [0] * (num_nodes + 1))
+        for source, target, label, weight in edges:
+            table.offsets[source + 1] += 1
+            table.targets.append(target)
+            table.labels.append(label)
+            table.weights.append(weight)
+        for i in xrange(num_nodes):
+            table.offsets[i + 1] += table.offsets[i]
+        return table
+
+    def dump(self):
+        return dict((name, (getattr(self, name).typecode, getattr(self, name).tostring()))
+                    for name in ['offsets', 'targets', 'labels', 'weights'])
+
+    @classmethod
+    def restore(cls, data):
+        table = cls()
+        for name, (typecode, values) in data.iteritems():
+            column = array(typecode)
+            column.fromstring(values)
+            setattr(table, name, column)
+        return table
+
+
+class IndexExporter(object):
+    # write an AdjacencyIndex as a network output format; takes the
+    # same options as the other exporters, but always indexes the
+    # individual (not aggregated) edges
+
+    def __init__(self, aggregate=False, label_counts=False):
+        self.aggregate = aggregate
+
+    def write(self, network, outfile):
+        if self.aggregate:
+            print 'Note: edges are not aggregated in network index %s' % outfile
+        AdjacencyIndex.from_network(network).save(outfile)
+
+
+def _open(filename, mode):
+    # open an index file, gzip-compressed if the filename ends with .gz
+    if filename.endswith('.gz'):
+        return gzip.open(filename, mode)
+    return open(filename, mode)
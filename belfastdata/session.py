@@ -0,0 +1,129 @@
+# shared http session for harvesting
+
+import json
+import os
+import random
+import threading
+import time
+from email.utils import parsedate_tz, mktime_tz
+
+import requests
+from requests.adapters import HTTPAdapter
+
+
+class HarvestSession(object):
+    # Pooled http session shared by the harvesters, so that repeated
+    # requests to the same host (e.g. thousands of VIAF lookups) reuse
+    # keep-alive connections instead of opening a new one each time.
+    # Requests that fail with a connection error, timeout, or one of
+    # the retry status codes are retried with exponential backoff,
+    # honoring any Retry-After header sent by the server.
+
+    # server errors and rate limiting are worth retrying
+    retry_statuses = (429, 500, 502, 503, 504)
+
+    def __init__(self, timeout=30, retries=3, backoff=1.0, max_backoff=120,
+                 pool_size=10):
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size,
+                              pool_maxsize=pool_size)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def get(self, url, **kwargs):
+        # GET a url, retrying as needed.  Returns the last response
+        # received (which may be an error status if retries ran out);
+        # raises the last exception if no response could be retrieved.
+        kwargs.setdefault('timeout', self.timeout)
+        attempt = 0
+        while True:
+            try:
+                response = self.session.get(url, **kwargs)
+            except (requests.ConnectionError, requests.Timeout):
+                if attempt >= self.retries:
+                    raise
+                delay = self._backoff(attempt)
+            else:
+                if response.status_code not in self.retry_statuses \
+                   or attempt >= self.retries:
+                    return response
+                delay = self._retry_after(response)
+                if delay is None:
+                    delay = self._backoff(attempt)
+
+            time.sleep(min(delay, self.max_backoff))
+            attempt += 1
+
+    def _backoff(self, attempt):
+        # exponential backoff, with jitter so concurrent workers
+        # don't all retry at the same moment
+        delay = self.backoff * (2 ** attempt)
+        return delay + random.uniform(0, self.backoff)
+
+    def _retry_after(self, response):
+        # delay in seconds requested by the server, if any;
+        # Retry-After may be a number of seconds or an http date
+        value = response.headers.get('retry-after')
+        if not value:
+            return None
+        try:
+            return max(0, int(value))
+        except ValueError:
+            date = parsedate_tz(value)
+            if date is not None:
+                return max(0, mktime_tz(date) - time.time())
+
+
+class RetryJournal(object):
+    # Record of urls that could not be harvested, saved as json so a
+    # later run can try them again.  Urls are removed from the journal
+    # once they are harvested successfully.
+
+    def __init__(self, filename):
+        self.filename = filename
+        self._lock = threading.Lock()
+        self.failures = {}
+        if os.path.exists(filename):
+            try:
+                with open(filename) as journal:
+                    self.failures = json.load(journal)
+            except ValueError:
+                pass
+
+    def urls(self):
+        # urls that failed on a previous run and should be retried
+        return sorted(self.failures.keys())
+
+    def failed(self, url, error):
+        with self._lock:
+            attempts = self.failures.get(url, {}).get('attempts', 0)
+            self.failures[url] = {
+                'error': unicode(error),
+                'attempts': attempts + 1,
+                'last_attempt': time.time(),
+            }
+
+    def succeeded(self, url):
+        with self._lock:
+            self.failures.pop(url, None)
+
+    def __contains__(self, url):
+        return url in self.failures
+
+    def __len__(self):
+        return len(self.failures)
+
+    def save(self):
+        with self._lock:
+            if not self.failures:
+                # nothing to retry; don't leave an empty journal around
+                if os.path.exists(self.filename):
+                    os.remove(self.filename)
+                return
+            with open(self.filename, 'w') as journal:
+                json.dump(self.failures, journal, indent=2, sort_keys=True)
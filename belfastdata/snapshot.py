@@ -0,0 +1,161 @@
+# binary snapshots of parsed rdf documents, to avoid re-parsing RDF/XML
+
+from array import array
+import cPickle as pickle
+import hashlib
+import os
+import tempfile
+import rdflib
+from rdflib.term import URIRef, BNode, Literal
+
+
+class SnapshotCache(object):
+    # Parsing RDF/XML is by far the most expensive way to load triples.
+    # This cache stores each parsed document in a compact binary form:
+    # a table of distinct terms (each stored once, and shared between
+    # triples when loaded) plus the triples as an array of integer term
+    # ids.  Snapshots are kept in a .snapshots directory alongside the
+    # data files, and are keyed on the modification time and size of the
+    # source file, falling back to a content hash if those have changed
+    # (e.g., after a fresh checkout); a snapshot is only used if it
+    # matches the current content of the file.
+
+    dirname = '.snapshots'
+    # increment if the snapshot format changes
+    format_version = 1
+
+    # term type codes
+    URI, BNODE, LITERAL = 0, 1, 2
+
+    def snapshot_file(self, filename):
+        return os.path.join(os.path.dirname(filename), self.dirname,
+                            '%s.snap' % os.path.basename(filename))
+
+    @staticmethod
+    def file_hash(filename):
+        sha1 = hashlib.sha1()
+        with open(filename, 'rb') as datafile:
+            for chunk in iter(lambda: datafile.read(65536), ''):
+                sha1.update(chunk)
+        return sha1.hexdigest()
+
+    def load(self, filename, format=None, graph=None):
+        # load a graph for the specified file, from a snapshot if a
+        # current one is available; otherwise parse the file and save
+        # a snapshot for next time.  If a graph is specified, triples
+        # are added to it (e.g. to load multiple files into one graph).
+        loaded = self._load_snapshot(filename, graph)
+        if loaded is not None:
+            return loaded
+
+        doc = rdflib.Graph()
+        doc.parse(filename, format=format)
+        self.save(filename, doc)
+        if graph is None:
+            return doc
+        graph += doc
+        return graph
+
+    def save(self, filename, graph):
+        # save a snapshot of the graph for the current content of the file
+        terms = {}
+        term_list = []
+        triples = array('I')
+        for triple in graph:
+            for term in triple:
+                term_id = terms.get(term)
+                if term_id is None:
+                    term_id = terms[term] = len(term_list)
+                    term_list.append(self._encode(term))
+                triples.append(term_id)
+
+        stat = os.stat(filename)
+        header = {
+            'version': self.format_version,
+            'mtime': stat.st_mtime,
+            'size': stat.st_size,
+            'hash': self.file_hash(filename),
+        }
+        snapfile = self.snapshot_file(filename)
+        snapdir = os.path.dirname(snapfile)
+        if not os.path.isdir(snapdir):
+            try:
+                os.mkdir(snapdir)
+            except OSError:
+                # possibly created by another process in the meantime
+                if not os.path.isdir(snapdir):
+                    raise
+
+        # write to a temporary file and rename, so a snapshot is never
+        # seen partially written by another process
+        fd, tmpname = tempfile.mkstemp(dir=snapdir)
+        with os.fdopen(fd, 'wb') as snapshot:
+            pickle.dump(header, snapshot, pickle.HIGHEST_PROTOCOL)
+            pickle.dump((list(graph.namespaces()), term_list, triples.tostring()),
+                        snapshot, pickle.HIGHEST_PROTOCOL)
+        os.rename(tmpname, snapfile)
+
+    def _load_snapshot(self, filename, graph=None):
+        snapfile = self.snapshot_file(filename)
+        if not os.path.exists(snapfile):
+            return None
+        try:
+            with open(snapfile, 'rb') as snapshot:
+                header = pickle.load(snapshot)
+                if not self._is_current(header, filename):
+                    return None
+                namespaces, term_list, triple_data = pickle.load(snapshot)
+        except (EOFError, pickle.UnpicklingError, ValueError, KeyError):
+            return None
+
+        if graph is None:
+            graph = rdflib.Graph()
+            for prefix, ns in namespaces:
+                graph.bind(prefix, ns)
+        terms = [self._decode(t) for t in term_list]
+        ids = array('I')
+        ids.fromstring(triple_data)
+        # add directly to the store, bypassing per-triple checks in
+        # Graph.add, since the triples are known to be valid
+        store = graph.store
+        for i in xrange(0, len(ids), 3):
+            store.add((terms[ids[i]], terms[ids[i + 1]], terms[ids[i + 2]]),
+                      graph, quoted=False)
+        return graph
+
+    def _is_current(self, header, filename):
+        if header.get('version') != self.format_version:
+            return False
+        stat = os.stat(filename)
+        if header['mtime'] == stat.st_mtime and header['size'] == stat.st_size:
+            return True
+        return header['size'] == stat.st_size and \
+            header['hash'] == self.file_hash(filename)
+
+    def _encode(self, term):
+        if isinstance(term, Literal):
+            return (self.LITERAL, unicode(term), term.language, term.datatype)
+        elif isinstance(term, BNode):
+            return (self.BNODE, unicode(term))
+        return (self.URI, unicode(term))
+
+    def _decode(self, data):
+        if data[0] == self.URI:
+            return URIRef(data[1])
+        elif data[0] == self.BNODE:
+            return BNode(data[1])
+        return Literal(data[1], lang=data[2], datatype=data[3])
+
+
+_cache = SnapshotCache()
+
+
+def load_graph(filename, format=None, graph=None):
+    # load an rdf file as a graph (or into an existing graph),
+    # using a snapshot if available
+    return _cache.load(filename, format=format, graph=graph)
+
+
+def save_snapshot(filename, graph):
+    # update the snapshot for a file that has just been written
+    _cache.save(filename, graph)
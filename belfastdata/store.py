@@ -0,0 +1,103 @@
+# optional persistent triple store for the merged dataset
+
+import os
+import urllib
+import rdflib
+
+from belfastdata.manifest import Manifest
+from belfastdata.snapshot import load_graph
+
+
+class PersistentStore(object):
+    # Persistent, on-disk rdf store holding the merged dataset, with
+    # one named graph per source file, as an alternative to loading
+    # every file into a single in-memory graph.  Loading is incremental:
+    # only files that have changed since they were last loaded are
+    # (re)loaded, and queries go directly to the store, so the dataset
+    # can be larger than available memory.
+    #
+    # Backends are rdflib store plugins: a path ending in .sqlite or .db
+    # uses SQLite via rdflib-sqlalchemy (optional dependency); any other
+    # path is used as a directory for the Sleepycat (Berkeley DB) store
+    # included with rdflib.
+
+    # store version, for tracking loaded files in the manifest
+    version = 1
+
+    def __init__(self, path, backend=None):
+        self.path = path
+        if backend is None:
+            if os.path.splitext(path)[1] in ('.sqlite', '.db'):
+                backend = 'SQLAlchemy'
+            else:
+                backend = 'Sleepycat'
+
+        if backend == 'SQLAlchemy':
+            try:
+                import rdflib_sqlalchemy
+            except ImportError:
+                raise ImportError('rdflib-sqlalchemy is required for SQLite storage')
+            # older versions require explicit plugin registration
+            if hasattr(rdflib_sqlalchemy, 'registerplugins'):
+                rdflib_sqlalchemy.registerplugins()
+            config = rdflib.Literal('sqlite:///%s' % os.path.abspath(path))
+        else:
+            config = path
+
+        self.graph = rdflib.ConjunctiveGraph(backend)
+        self.graph.open(config, create=True)
+        # record of which file content is currently loaded in the store
+        self.manifest = Manifest('%s.manifest.json' % path.rstrip('/'))
+
+    def context_id(self, filename):
+        # named graph identifier for a source file
+        return rdflib.URIRef('file://%s' % urllib.pathname2url(os.path.abspath(filename)))
+
+    def sync(self, files, graphs=None, verbosity=1):
+        # load any new or modified files into the store, replacing the
+        # previously loaded content for those files; optionally takes a
+        # dictionary of already loaded graphs keyed on filename.
+        # Named graphs for files that no longer exist are removed.
+        # Named graphs for other files loaded previously are kept, so
+        # read the data for these files with graphs() rather than
+        # from the store as a whole.
+        graphs = graphs or {}
+        loaded = 0
+        for filename in files:
+            if filename not in graphs and \
+               self.manifest.is_current(filename, [self]):
+                continue
+            try:
+                if filename in graphs:
+                    doc = graphs[filename]
+                else:
+                    doc = load_graph(filename)
+            except Exception as err:
+                print "Error parsing '%s' as RDF -- %s" % (filename, err)
+                continue
+            context = self.graph.get_context(self.context_id(filename))
+            self.graph.remove_context(context)
+            self.graph.addN((s, p, o, context) for s, p, o in doc)
+            self.manifest.record(filename, [self])
+            loaded += 1
+
+        for filename in list(self.manifest.entries):
+            if not os.path.exists(filename):
+                self.graph.remove_context(self.graph.get_context(self.context_id(filename)))
+                del self.manifest.entries[filename]
+
+        self.graph.commit()
+        self.manifest.save()
+        if verbosity >= 1 and loaded:
+            print 'Loaded %d file%s into %s' % \
+                (loaded, 's' if loaded != 1 else '', self.path)
+
+    def graphs(self, files):
+        # named graphs for the specified files (as loaded by sync);
+        # files that have not been loaded are skipped
+        for filename in files:
+            if filename in self.manifest.entries:
+                yield self.graph.get_context(self.context_id(filename))
+
+    def close(self):
+        self.graph.close()
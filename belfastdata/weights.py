@@ -0,0 +1,163 @@
+# configurable edge weights for generated networks, based on
+# the type of rdf relation
+
+import json
+import rdflib
+
+from belfastdata.rdfns import ARCH, SCHEMA_ORG, DC, DCMITYPE, BIBO, BG
+
+DBPEDIA_OWL = rdflib.Namespace('http://dbpedia.org/ontology/')
+
+# first-pass attempt to generate weighted network based on
+# type of rdf relation; keyed on full predicate uri
+default_weights = {
+    rdflib.OWL.sameAs: 10,
+    SCHEMA_ORG.sameAs: 10,
+    SCHEMA_ORG.spouse: 9,
+    SCHEMA_ORG.founder: 7,
+    SCHEMA_ORG.founderOf: 7,
+    SCHEMA_ORG.colleague: 4,
+    SCHEMA_ORG.member: 5,
+    SCHEMA_ORG.memberOf: 5,
+    SCHEMA_ORG.knows: 2,
+    ARCH.correspondedWith: 2,
+    SCHEMA_ORG.publisher: 3,
+    SCHEMA_ORG.association: 1,
+    SCHEMA_ORG.affiliation: 1,
+    SCHEMA_ORG.worksFor: 4,
+    SCHEMA_ORG.mentions: 1,
+    SCHEMA_ORG.alumniOf: 3,
+
+    SCHEMA_ORG.about: 6,
+    SCHEMA_ORG.creator: 7,
+    DC.creator: 7,
+    SCHEMA_ORG.author: 7,
+    SCHEMA_ORG.contributor: 6,
+    DC.contributor: 6,
+    SCHEMA_ORG.relatedLink: 4,
+    DC.title: 3,
+    SCHEMA_ORG.hasPart: 5,
+    DC.hasPart: 5,
+
+    DBPEDIA_OWL.birthPlace: 5,
+    SCHEMA_ORG.birthPlace: 5,
+    SCHEMA_ORG.workLocation: 4,
+    SCHEMA_ORG.location: 4,
+    SCHEMA_ORG.homeLocation: 4,
+}
+
+# prefixes that can be used instead of full uris in a weights file
+prefixes = {
+    'rdf': unicode(rdflib.RDF),
+    'rdfs': unicode(rdflib.RDFS),
+    'owl': unicode(rdflib.OWL),
+    'schema': unicode(SCHEMA_ORG),
+    'dc': unicode(DC),
+    'dcmitype': unicode(DCMITYPE),
+    'arch': unicode(ARCH),
+    'bibo': unicode(BIBO),
+    'bg': unicode(BG),
+    'dbpedia-owl': unicode(DBPEDIA_OWL),
+}
+
+
+class PredicateWeights(object):
+    # Edge labels and weights for rdf predicates, used by
+    # belfastdata.nx.Rdf2Gexf.  Weights are keyed on full predicate uri,
+    # so the same local name in different namespaces can be weighted
+    # differently, and can be overridden for subjects of a particular
+    # rdf type.  Labels and weights are cached by predicate, since the
+    # same few predicates are looked up for every triple.
+    #
+    # Load a weighting scheme from a json file with load(filename):
+    #
+    #   {
+    #     "default": 1,
+    #     "weights": {"schema:knows": 3, "http://schema.org/spouse": 9},
+    #     "types": {"schema:Person": {"schema:affiliation": 2}},
+    #     "labels": {"dc:title": "title"},
+    #     "include_defaults": true
+    #   }
+    #
+    # All keys are optional.  Predicates and types may be full uris or
+    # use one of the prefixes above.  Weights in the file are combined
+    # with default_weights unless include_defaults is false; predicates
+    # with no configured weight get the default weight.  Labels default
+    # to the local name of the predicate uri.
+
+    def __init__(self, weights=None, types=None, labels=None, default=1,
+                 include_defaults=True):
+        self.weights = {}
+        if include_defaults:
+            self.weights.update(default_weights)
+        self.weights.update(weights or {})
+        # type uri -> {predicate uri: weight}
+        self.types = types or {}
+        self.labels = labels or {}
+        self.default = default
+        # predicates with a weight that depends on the subject type
+        self.typed_predicates = set(pred for overrides in self.types.itervalues()
+                                    for pred in overrides)
+        self._label_cache = {}
+        self._weight_cache = {}
+
+    @classmethod
+    def load(cls, filename):
+        with open(filename) as config_file:
+            config = json.load(config_file)
+
+        def weights(values):
+            return dict((_uri(key), value) for key, value in values.iteritems())
+
+        return cls(weights=weights(config.get('weights', {})),
+                   types=dict((_uri(key), weights(values)) for key, values
+                              in config.get('types', {}).iteritems()),
+                   labels=dict((_uri(key), value) for key, value
+                               in config.get('labels', {}).iteritems()),
+                   default=config.get('default', 1),
+                   include_defaults=config.get('include_defaults', True))
+
+    def label(self, pred):
+        # short-hand name for a predicate, as an edge label or node attribute
+        try:
+            return self._label_cache[pred]
+        except KeyError:
+            pass
+        label = self.labels.get(pred)
+        if label is None:
+            try:
+                ns, label = rdflib.namespace.split_uri(pred)
+            except ValueError:
+                # uri can't be split (e.g. ends with a slash)
+                label = unicode(pred)
+        self._label_cache[pred] = label
+        return label
+
+    def weight(self, pred, types=None):
+        # weight for an edge with the specified predicate; types is an
+        # optional list of rdf types of the subject, for per-type
+        # overrides (if the subject has more than one overriding type,
+        # the highest weight is used)
+        if types and pred in self.typed_predicates:
+            overrides = [self.types[t][pred] for t in types
+                         if pred in self.types.get(t, {})]
+            if overrides:
+                return max(overrides)
+        try:
+            return self._weight_cache[pred]
+        except KeyError:
+            weight = self.weights.get(pred, self.default)
+            self._weight_cache[pred] = weight
+            return weight
+
+    def is_typed(self, pred):
+        # true if the weight for a predicate may depend on subject type
+        return pred in self.typed_predicates
+
+
+def _uri(value):
+    # expand a prefixed name (e.g. schema:knows) to a uri
+    prefix, sep, name = value.partition(':')
+    if sep and prefix in prefixes and not name.startswith('//'):
+        return rdflib.URIRef(prefixes[prefix] + name)
+    return rdflib.URIRef(value)
@@ -0,0 +1,72 @@
+# import-time benchmark for belfastdata modules and scripts; run from
+# the top-level directory with
+#   PYTHONPATH=. python benchmarks/importtime.py
+# Each measurement uses a new python process, so nothing is already
+# loaded, and reports which of the slow third-party libraries each
+# module pulls in.
+
+import os
+import subprocess
+import sys
+import time
+
+# third-party libraries that are slow to import
+libraries = ['rdflib', 'networkx', 'requests', 'lxml', 'django']
+
+modules = [
+    'belfastdata.manifest', 'belfastdata.network', 'belfastdata.export',
+    'belfastdata.query', 'belfastdata.normalize', 'belfastdata.weights',
+    'belfastdata.snapshot', 'belfastdata.pipeline', 'belfastdata.clean',
+    'belfastdata.dedup', 'belfastdata.store', 'belfastdata.session',
+    'belfastdata.harvest', 'belfastdata.qub', 'belfastdata.nx',
+    'belfastdata.analytics',
+]
+
+scripts = ['belfast_dataset', 'rdf2gexf', 'network-query', 'harvest-rdf',
+           'harvest-related', 'queens_belfast_rdf', 'smush-groupsheets']
+
+script_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                          '..', 'scripts')
+
+
+def import_time(module, repeat=3):
+    # best import time in seconds for a module, and the slow
+    # libraries it loaded
+    code = '''import sys, time
+start = time.time()
+import %s
+elapsed = time.time() - start
+print elapsed, ','.join(l for l in %r if l in sys.modules)''' % (module, libraries)
+    results = []
+    for i in range(repeat):
+        output = subprocess.check_output([sys.executable, '-c', code])
+        elapsed, loaded = output.split()[0], output.split()[1:]
+        results.append((float(elapsed), loaded[0] if loaded else ''))
+    return min(results)
+
+
+def script_time(script, args=('--help', ), repeat=3):
+    # best time in seconds to run a script with the specified arguments
+    # (by default, just to show the help), including python startup
+    path = os.path.join(script_dir, script)
+    best = None
+    with open(os.devnull, 'w') as devnull:
+        for i in range(repeat):
+            start = time.time()
+            subprocess.call([sys.executable, path] + list(args),
+                            stdout=devnull, stderr=devnull)
+            elapsed = time.time() - start
+            best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+if __name__ == '__main__':
+    print 'module import times:'
+    for module in modules:
+        elapsed, loaded = import_time(module)
+        print '  %-24s %6.1fms  %s' % (module, elapsed * 1000, loaded)
+
+    if os.path.isdir(script_dir):
+        print 'script --help times (including python startup):'
+        for script in scripts:
+            print '  %-24s %6.1fms' % (script, script_time(script) * 1000)
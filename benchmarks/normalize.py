@@ -0,0 +1,90 @@
+# micro-benchmark: smush key calculation per group sheet, with django
+# slugify and rdflib collections (the implementation before
+# belfastdata.normalize) vs. belfastdata.normalize; run from the
+# top-level directory with
+#   PYTHONPATH=. python benchmarks/normalize.py data/*.xml
+
+import hashlib
+import sys
+import timeit
+
+import rdflib
+from rdflib import collection as rdfcollection
+
+from belfastdata.clean import SmushGroupSheets
+from belfastdata.normalize import smush_key
+from belfastdata.rdfns import BG, DC
+from belfastdata.snapshot import load_graph
+
+try:
+    from django.utils.text import slugify as django_slugify
+except ImportError:
+    django_slugify = None
+
+
+smush = SmushGroupSheets()
+
+
+def old_key(uri, graph):
+    # previous implementation of SmushGroupSheets.calculate_uri titles
+    titles = []
+    title = graph.value(uri, DC.title)
+    if isinstance(title, rdflib.Literal):
+        titles.append(title)
+    elif title:
+        titles.extend(rdfcollection.Collection(graph, title))
+    titles = sorted([django_slugify(t) for t in titles])
+    author = smush._author(uri, graph)
+    if not titles and not author:
+        return
+    return u'%s %s' % (author or 'anonymous', ' '.join(titles))
+
+
+def old_normalize(author, titles):
+    # previous title normalization only
+    titles = sorted([django_slugify(t) for t in titles])
+    return u'%s %s' % (author or 'anonymous', ' '.join(titles))
+
+
+def per_sheet(func, count):
+    # best time per group sheet in microseconds
+    return min(timeit.repeat(func, number=10, repeat=3)) / 10 / count * 1000000
+
+
+def run(sheets, key_function):
+    for uri, graph in sheets:
+        key = key_function(uri, graph)
+        if key is not None:
+            hashlib.md5(key.encode('utf-8')).hexdigest()
+
+
+if __name__ == '__main__':
+    sheets = []
+    for filename in sys.argv[1:]:
+        graph = load_graph(filename)
+        sheets.extend((m, graph) for m in
+                      graph.subjects(predicate=rdflib.RDF.type, object=BG.GroupSheet))
+    if not sheets:
+        print 'No group sheets found'
+        sys.exit(1)
+
+    # author and titles, for timing normalization separately from rdf lookups
+    inputs = []
+    for uri, graph in sheets:
+        title = graph.value(uri, DC.title)
+        titles = list(graph.items(title)) if isinstance(title, rdflib.BNode) \
+            else [title] if title else []
+        inputs.append((smush._author(uri, graph), titles))
+
+    print '%d group sheets' % len(sheets)
+    timings = [('cached', lambda: run(sheets, smush.smush_key),
+                lambda: [smush_key(a, t) for a, t in inputs])]
+    if django_slugify is not None:
+        # compare results before timing
+        assert all(old_key(uri, graph) == smush.smush_key(uri, graph)
+                   for uri, graph in sheets)
+        timings.insert(0, ('django', lambda: run(sheets, old_key),
+                           lambda: [old_normalize(a, t) for a, t in inputs]))
+    for label, total, normalization in timings:
+        print '%s: %.1fus per group sheet (normalization only: %.1fus)' % \
+            (label, per_sheet(total, len(sheets)), per_sheet(normalization, len(sheets)))
@@ -35,9 +35,8 @@ setup(
     install_requires=[
         'rdflib>=3.0',
         'requests>=1.1',
-        'BeautifulSoup4',
+        'lxml',
         'progressbar',  # make optional?
-        'Django',
         'networkx',
     ],
 
@@ -53,6 +52,6 @@ setup(
     classifiers=CLASSIFIERS,
     scripts=['scripts/harvest-rdf', 'scripts/harvest-related',
              'scripts/queens_belfast_rdf', 'scripts/smush-groupsheets',
-             'gscripts/rdf2gexf',
+             'gscripts/rdf2gexf', 'scripts/network-query',
              'scripts/belfast_dataset'],
 )
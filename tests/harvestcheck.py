@@ -0,0 +1,204 @@
+# deterministic check of concurrent harvesting against a local http
+# server; run from the top-level directory with
+#   PYTHONPATH=. python tests/harvestcheck.py
+# (or just python tests/harvestcheck.py, with belfastdata installed)
+# Serves a small site of linked RDFa pages under two host names
+# (127.0.0.1 and localhost, on the same port) and harvests it with
+# HarvestRdf, checking that:
+#  - a threaded harvest saves the same files and triples as a serial one
+#  - no more than max_per_host requests to a host are ever in progress
+#  - with a delay, requests to a host are spread out: the nth request
+#    to a host arrives at least (n - 1) * delay after harvesting starts
+#    (the time between any two particular requests may be shorter, since
+#    a worker may be held up after its turn, e.g. waiting for the GIL)
+# Nothing outside of localhost is contacted.
+
+import BaseHTTPServer
+import os
+import shutil
+import SocketServer
+import sys
+import tempfile
+import threading
+import time
+
+import rdflib
+
+from belfastdata.harvest import HarvestRdf
+
+# number of pages served for each host name
+PAGES = 30
+HOSTS = ['127.0.0.1', 'localhost']
+# time each response takes, so that concurrent requests overlap
+RESPONSE_TIME = 0.02
+
+PAGE_TEMPLATE = '''<html xmlns="http://www.w3.org/1999/xhtml">
+<head><title>page %(num)d</title></head>
+<body prefix="schema: http://schema.org/ dcterms: http://purl.org/dc/terms/">
+<div about="%(url)s">
+<span property="dcterms:title">Page %(num)d on %(host)s</span>
+%(links)s
+</div>
+</body>
+</html>'''
+
+
+def page_url(host, port, num):
+    return 'http://%s:%d/page/%d' % (host, port, num)
+
+
+def page(host, port, num):
+    # RDFa for a single page: part of a binary tree of pages on the
+    # same host, with a related link to the same page on the other host
+    links = []
+    for child in (2 * num + 1, 2 * num + 2):
+        if child < PAGES:
+            links.append('<a rel="dcterms:hasPart" href="%s">%d</a>' %
+                         (page_url(host, port, child), child))
+    other = HOSTS[(HOSTS.index(host) + 1) % len(HOSTS)]
+    links.append('<a rel="schema:relatedLink" href="%s">related</a>' %
+                 page_url(other, port, num))
+    return PAGE_TEMPLATE % {'num': num, 'host': host, 'links': '\n'.join(links),
+                            'url': page_url(host, port, num)}
+
+
+class RequestLog(object):
+    # requests in progress and request start times, by host
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.started = time.time()
+        self.active = dict((host, 0) for host in HOSTS)
+        self.max_active = dict((host, 0) for host in HOSTS)
+        self.starts = dict((host, []) for host in HOSTS)
+
+    def start(self, host):
+        with self.lock:
+            self.active[host] += 1
+            self.max_active[host] = max(self.max_active[host], self.active[host])
+            self.starts[host].append(time.time())
+
+    def end(self, host):
+        with self.lock:
+            self.active[host] -= 1
+
+    def rate_limited(self, host, delay):
+        # true if no request to the host arrived before the earliest time
+        # it could have with the specified delay between requests
+        # (allowing for timer resolution)
+        return all(start >= self.started + n * delay - 0.001
+                   for n, start in enumerate(sorted(self.starts[host])))
+
+
+class PageHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        host, port = self.headers.get('host').split(':')
+        log = self.server.request_log
+        log.start(host)
+        time.sleep(RESPONSE_TIME)
+        # the request is finished once the client can read the response,
+        # so record that before sending it; otherwise the client may
+        # start its next request before this one is counted as done
+        log.end(host)
+
+        try:
+            num = int(self.path.rstrip('/').split('/')[-1])
+        except ValueError:
+            num = None
+        if host not in HOSTS or num is None or not 0 <= num < PAGES:
+            self.send_error(404)
+            return
+        content = page(host, int(port), num)
+        self.send_response(200)
+        self.send_header('content-type', 'text/html; charset=utf-8')
+        self.send_header('content-length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, format, *args):
+        # don't report each request
+        pass
+
+
+class LocalServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+
+    def __init__(self):
+        BaseHTTPServer.HTTPServer.__init__(self, ('127.0.0.1', 0), PageHandler)
+        self.request_log = RequestLog()
+        self.port = self.server_address[1]
+        self.thread = threading.Thread(target=self.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+
+
+def harvested_data(output_dir):
+    # saved files and the triples in each, keyed on filename
+    data = {}
+    for filename in os.listdir(output_dir):
+        if filename.endswith('.xml'):
+            graph = rdflib.Graph()
+            graph.parse(os.path.join(output_dir, filename))
+            data[filename] = set(graph)
+    return data
+
+
+def harvest(server, workers, max_per_host=2, delay=None):
+    # harvest the local site starting from the first page on the first
+    # host; returns the harvester, the harvested data, and the request log
+    output_dir = tempfile.mkdtemp(prefix='harvestcheck-')
+    server.request_log.reset()
+    try:
+        harvester = HarvestRdf([page_url(HOSTS[0], server.port, 0)],
+                               output_dir, find_related=True, verbosity=0,
+                               workers=workers, max_per_host=max_per_host,
+                               delay=delay)
+        return harvester, harvested_data(output_dir), server.request_log
+    finally:
+        shutil.rmtree(output_dir)
+
+
+def check(description, ok):
+    print '%s %s' % ('ok  ' if ok else 'FAIL', description)
+    return ok
+
+
+if __name__ == '__main__':
+    # requests honors proxy settings from the environment;
+    # the local server must be contacted directly
+    os.environ['no_proxy'] = ','.join(HOSTS)
+    server = LocalServer()
+    results = []
+    expected = PAGES * len(HOSTS)
+
+    start = time.time()
+    serial, serial_data, log = harvest(server, workers=1)
+    serial_time = time.time() - start
+    results.append(check('serial harvest saved %d of %d pages (%d errors)' %
+                         (len(serial_data), expected, serial.errors),
+                         len(serial_data) == expected and not serial.errors))
+
+    start = time.time()
+    threaded, threaded_data, log = harvest(server, workers=6, max_per_host=2)
+    threaded_time = time.time() - start
+    results.append(check('threaded harvest saved the same files and triples',
+                         threaded_data == serial_data and not threaded.errors))
+    results.append(check('at most 2 concurrent requests per host (max: %s)' %
+                         ', '.join('%s %d' % (h, log.max_active[h]) for h in HOSTS),
+                         all(log.max_active[h] <= 2 for h in HOSTS)))
+    print '     serial %.2fs, threaded %.2fs' % (serial_time, threaded_time)
+
+    delay = 0.05
+    delayed, delayed_data, log = harvest(server, workers=4, max_per_host=2,
+                                         delay=delay)
+    results.append(check('with %.2fs delay, saved the same files and triples' % delay,
+                         delayed_data == serial_data and not delayed.errors))
+    results.append(check('requests to each host spread out by %.2fs delay' % delay,
+                         all(log.rate_limited(h, delay) for h in HOSTS)))
+
+    server.shutdown()
+    sys.exit(0 if all(results) else 1)